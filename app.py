@@ -2,6 +2,11 @@ import streamlit as st
 from app.components.image_to_image import image_to_image_tab
 from app.components.style_transfer import style_transfer_tab
 from app.components.product_editing import product_editing_tab
+from app.components.edit_pipeline import edit_pipeline_tab
+from app.components.request_controls import (
+    session_memory_view,
+    timeout_metrics_view,
+)
 
 # Set page config
 st.set_page_config(
@@ -23,11 +28,12 @@ def main():
     - Virtual Try On: See how clothing would look on a person
     - Image Transformations: Apply style transfer and other effects
     - Product Editing: Enhance product images for commercial use
+    - Edit Pipeline: Chain product edits and compare effect variants
     """)
 
     # Create tabs
-    tab1, tab2, tab3 = st.tabs(
-        ["Virtual Try On", "Image Transformations", "Product Editing"]
+    tab1, tab2, tab3, tab4 = st.tabs(
+        ["Virtual Try On", "Image Transformations", "Product Editing", "Edit Pipeline"]
     )
 
     # Tab content
@@ -40,6 +46,9 @@ def main():
     with tab3:
         product_editing_tab()
 
+    with tab4:
+        edit_pipeline_tab()
+
     # Sidebar
     with st.sidebar:
         st.subheader("How It Works")
@@ -48,6 +57,7 @@ def main():
         - **Virtual Try On**: Try clothes on a person
         - **Image Transformations**: Style transfer and image edits
         - **Product Editing**: Enhance product photos
+        - **Edit Pipeline**: Chain several product edits
 
         ### 2. Upload Image(s)
         Upload one or more images to work with
@@ -59,6 +69,12 @@ def main():
         Click the button to process your images with AI
         """)
 
+        with st.expander("Request timings"):
+            timeout_metrics_view()
+
+        with st.expander("Memory usage"):
+            session_memory_view()
+
         # Add credits
         st.markdown("---")
         st.caption("Built with Streamlit and Google Gemini")
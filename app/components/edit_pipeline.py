@@ -0,0 +1,200 @@
+import streamlit as st
+
+from app.components.product_editing import EFFECTS, product_edit_prompt
+from app.components.request_controls import request_deadline, show_cancelled_notice
+from app.utils.deadline import Cancelled, Deadline, DeadlineExceeded
+from app.utils.gemini_client import (
+    image_to_image_generation as gemini_image_generation,
+    extract_response_bytes as gemini_extract_response_bytes,
+)
+from app.utils.openai_client import (
+    image_to_image_generation as openai_image_generation,
+    extract_response_bytes as openai_extract_response_bytes,
+)
+from app.utils.output_check import check_output, generate_checked, parse_aspect
+from app.utils.pipeline import PipelineStep, StepCache, run_pipeline
+from app.utils.traffic_capture import record_request
+
+# Presets that can be chained; "Replace background" needs a second image
+PIPELINE_PRESETS = [
+    "Background removal",
+    "Change product color",
+    "Enhance quality",
+    "Custom edit",
+]
+
+
+@st.cache_resource
+def get_step_cache():
+    """Step outputs shared by all sessions, keyed by their upstream inputs."""
+    return StepCache()
+
+
+def edit_pipeline_tab():
+    """Streamlit component for chaining product edits into a pipeline."""
+
+    st.header("Edit Pipeline")
+    st.write(
+        "Chain product edits. Each step's result is cached, so changing a "
+        "step only reruns that step and the ones after it."
+    )
+
+    # Model selection
+    st.subheader("Model Selection")
+    model_provider = st.selectbox(
+        "Select AI provider", ["Google Gemini", "OpenAI"], key="pipeline_provider"
+    )
+
+    image_size = None
+    if model_provider == "Google Gemini":
+        gemini_models = ["gemini-2.0-flash-preview-image-generation"]
+        model_name = st.selectbox(
+            "Select Gemini model", gemini_models, key="pipeline_gemini_model"
+        )
+    else:  # OpenAI
+        openai_models = ["gpt-image-1"]
+        model_name = st.selectbox(
+            "Select OpenAI model", openai_models, key="pipeline_openai_model"
+        )
+        size_options = ["1024x1024", "1536x1024", "1024x1536"]
+        image_size = st.selectbox("Image size", size_options, key="pipeline_size")
+
+    uploaded_file = st.file_uploader(
+        "Upload product image", type=["jpg", "jpeg", "png"], key="pipeline_image"
+    )
+
+    if uploaded_file is None:
+        st.info("Please upload a product image to begin.")
+        return
+
+    st.image(uploaded_file, caption="Original Product Image", use_container_width=True)
+
+    # Pipeline definition
+    st.subheader("Steps")
+    presets = st.multiselect(
+        "Steps, in the order they are applied",
+        PIPELINE_PRESETS,
+        default=["Background removal", "Change product color"],
+        key="pipeline_steps",
+    )
+
+    steps = []
+    parent = None
+    for preset in presets:
+        if preset == "Change product color":
+            option = st.color_picker(
+                "New product color", "#00BFFF", key="pipeline_color"
+            )
+        elif preset == "Custom edit":
+            option = st.text_area(
+                "Custom editing instructions",
+                "Edit this product image to...",
+                key="pipeline_custom",
+            )
+        else:
+            option = None
+        steps.append(PipelineStep(preset, product_edit_prompt(preset, option), parent))
+        parent = preset
+
+    effects = st.multiselect(
+        "Effect variants (each runs as its own branch)",
+        EFFECTS,
+        default=["soft shadow"],
+        key="pipeline_effects",
+    )
+    for effect in effects:
+        prompt = product_edit_prompt("Add effects/filters", effect)
+        steps.append(PipelineStep(f"Effect: {effect}", prompt, parent))
+
+    if not steps:
+        st.info("Select at least one step or effect.")
+        return
+
+    show_cancelled_notice("pipeline")
+
+    if st.button("Run Pipeline", key="pipeline_button"):
+        request = request_deadline("pipeline")
+        source = uploaded_file.getvalue()
+        record_request(
+            "pipeline",
+            " > ".join(step.name for step in steps),
+            model_provider,
+            [source],
+        )
+
+        def generate(image_bytes, prompt):
+            # Each step gets its own time budget but shares the Cancel button
+            deadline = Deadline(token=request.token)
+
+            def attempt():
+                if model_provider == "Google Gemini":
+                    response = gemini_image_generation(
+                        image_bytes, prompt, model=model_name, deadline=deadline
+                    )
+                    return gemini_extract_response_bytes(response), None
+                response = openai_image_generation(
+                    image_bytes,
+                    prompt,
+                    model=model_name,
+                    size=image_size,
+                    deadline=deadline,
+                )
+                return openai_extract_response_bytes(response, deadline=deadline), None
+
+            # Retry a step whose output is blank, unchanged or mis-sized
+            data, _, problem = generate_checked(
+                attempt,
+                lambda output: check_output(
+                    output, image_bytes, parse_aspect(image_size)
+                ),
+                deadline,
+            )
+            return data, problem
+
+        with st.spinner("Running pipeline..."):
+            try:
+                results = run_pipeline(
+                    source,
+                    steps,
+                    generate,
+                    get_step_cache(),
+                    context=f"{model_provider}|{model_name}|{image_size}",
+                    on_tick=request.on_tick,
+                    token=request.token,
+                )
+            except Cancelled:
+                st.info("Request cancelled.")
+                return
+            except DeadlineExceeded as e:
+                st.error(f"The request timed out: {str(e)}")
+                return
+            except Exception as e:
+                st.error(f"Error running pipeline: {str(e)}")
+                return
+
+        for step in steps:
+            result = results.get(step.name)
+            if result is None:
+                st.warning(
+                    f"{step.name}: no image was generated for this step or "
+                    "an earlier one."
+                )
+                continue
+            status = "cached" if result.cached else f"{result.seconds:.1f}s"
+            file_stem = "".join(c if c.isalnum() else "_" for c in step.name)
+            st.image(
+                result.data,
+                caption=f"{step.name} ({status})",
+                use_container_width=True,
+            )
+            if result.problem:
+                st.warning(
+                    f"{step.name}: this result may be wrong: {result.problem}. "
+                    "It was not cached, so the next run tries again."
+                )
+            st.download_button(
+                "Download",
+                result.data,
+                file_name=f"{file_stem.lower()}.png",
+                key=f"pipeline_download_{step.name}",
+            )
@@ -1,5 +1,4 @@
 import streamlit as st
-import PIL.Image
 
 from app.utils.gemini_client import (
     multi_image_generation as gemini_multi_image_generation,
@@ -11,6 +10,10 @@ from app.utils.openai_client import (
     extract_response_image as openai_extract_response_image,
     extract_response_text as openai_extract_response_text,
 )
+from app.components.request_controls import request_deadline, show_cancelled_notice
+from app.utils.deadline import Cancelled, DeadlineExceeded
+from app.utils.output_check import check_output, generate_checked, parse_aspect
+from app.utils.traffic_capture import record_request
 
 
 def image_to_image_tab():
@@ -23,6 +26,7 @@ def image_to_image_tab():
     st.subheader("Model Selection")
     model_provider = st.selectbox("Select AI provider", ["Google Gemini", "OpenAI"])
 
+    image_size = None
     if model_provider == "Google Gemini":
         gemini_models = ["gemini-2.0-flash-preview-image-generation"]
         model_name = st.selectbox("Select Gemini model", gemini_models)
@@ -44,8 +48,9 @@ def image_to_image_tab():
             key="tryon_person",
         )
         if primary_file:
-            primary_image = PIL.Image.open(primary_file)
-            st.image(primary_image, caption="Person Image", use_container_width=True)
+            # Shown from the upload itself; decoding it here would keep a
+            # full-size bitmap around on every rerun
+            st.image(primary_file, caption="Person Image", use_container_width=True)
 
     with col2:
         clothing_file = st.file_uploader(
@@ -54,8 +59,7 @@ def image_to_image_tab():
             key="tryon_clothing",
         )
         if clothing_file:
-            clothing_image = PIL.Image.open(clothing_file)
-            st.image(clothing_image, caption="Clothing Image", use_container_width=True)
+            st.image(clothing_file, caption="Clothing Image", use_container_width=True)
 
     # Try-on options
     if primary_file is not None:
@@ -104,9 +108,12 @@ def image_to_image_tab():
         if additional_instructions:
             prompt += f" Additionally: {additional_instructions}"
 
+        show_cancelled_notice("tryon")
+
         # Generate button
         if st.button("Generate Try-On Image"):
             if primary_file:
+                deadline = request_deadline("tryon")
                 with st.spinner("Generating virtual try-on..."):
                     try:
                         # Get image bytes from uploaded files
@@ -120,19 +127,45 @@ def image_to_image_tab():
                             clothing_bytes = clothing_file.read()
                             images.append(clothing_bytes)
 
+                        record_request(
+                            "tryon",
+                            "Reference clothing" if clothing_file else clothing_type,
+                            model_provider,
+                            images,
+                        )
+
                         # Call the selected API
-                        if model_provider == "Google Gemini":
-                            response = gemini_multi_image_generation(
-                                images, prompt, model=model_name
-                            )
-                            output_image = gemini_extract_response_image(response)
-                            output_text = gemini_extract_response_text(response)
-                        else:  # OpenAI
+                        def generate():
+                            if model_provider == "Google Gemini":
+                                response = gemini_multi_image_generation(
+                                    images, prompt, model=model_name, deadline=deadline
+                                )
+                                return (
+                                    gemini_extract_response_image(response),
+                                    gemini_extract_response_text(response),
+                                )
                             response = openai_multi_image_generation(
-                                images, prompt, model=model_name, size=image_size
+                                images,
+                                prompt,
+                                model=model_name,
+                                size=image_size,
+                                deadline=deadline,
+                            )
+                            return (
+                                openai_extract_response_image(
+                                    response, deadline=deadline
+                                ),
+                                openai_extract_response_text(response),
                             )
-                            output_image = openai_extract_response_image(response)
-                            output_text = openai_extract_response_text(response)
+
+                        # Retry outputs that are blank, unchanged or mis-sized
+                        output_image, output_text, problem = generate_checked(
+                            generate,
+                            lambda image: check_output(
+                                image, primary_bytes, parse_aspect(image_size)
+                            ),
+                            deadline,
+                        )
 
                         # Display response
                         if output_image:
@@ -141,6 +174,8 @@ def image_to_image_tab():
                                 caption="Virtual Try-On Result",
                                 use_container_width=True,
                             )
+                            if problem:
+                                st.warning(f"This result may be wrong: {problem}.")
                         else:
                             if output_text:
                                 st.write("**Model Response:**")
@@ -157,6 +192,10 @@ def image_to_image_tab():
                             )
                             st.info(tips)
 
+                    except Cancelled:
+                        st.info("Request cancelled.")
+                    except DeadlineExceeded as e:
+                        st.error(f"The request timed out: {str(e)}")
                     except Exception as e:
                         st.error(f"Error generating try-on: {str(e)}")
                         if model_provider == "Google Gemini":
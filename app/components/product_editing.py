@@ -13,6 +13,219 @@ from app.utils.openai_client import (
     extract_response_image as openai_extract_response_image,
     extract_response_text as openai_extract_response_text,
 )
+from app.components.request_controls import request_deadline, show_cancelled_notice
+from app.utils.deadline import Cancelled, DeadlineExceeded
+from app.utils.output_check import (
+    DEFAULT_MAX_ATTEMPTS,
+    check_output,
+    generate_checked,
+    parse_aspect,
+)
+from app.utils.traffic_capture import record_request
+from app.utils.edit_session import GeminiEditSession, OpenAIEditSession
+from app.utils.session_memory import current_session_id, get_session_memory
+from app.utils.speculation import ESTIMATED_COST, get_speculator
+from app.utils.region_edit import (
+    blend_region,
+    detect_product_box,
+    encode_region,
+    pad_box,
+    percent_box,
+)
+
+EDITING_TYPES = [
+    "Background removal",
+    "Replace background",
+    "Change product color",
+    "Add effects/filters",
+    "Enhance quality",
+    "Custom edit",
+]
+
+EFFECTS = [
+    "soft shadow",
+    "glossy reflection",
+    "dramatic lighting",
+    "studio lighting",
+    "minimalist",
+]
+
+# Presets with a fixed prompt, which can be started before the user asks
+SPECULATIVE_PRESETS = ["Background removal", "Enhance quality"]
+
+# Operations that only touch the product, so a region crop is enough
+REGION_EDIT_TYPES = [
+    "Change product color",
+    "Add effects/filters",
+    "Enhance quality",
+    "Custom edit",
+]
+
+
+def product_edit_prompt(editing_type, option=None):
+    """Build the prompt for a single-image product editing preset.
+
+    Args:
+        editing_type: One of ``EDITING_TYPES`` other than "Replace background".
+        option: The color for "Change product color", the effect for
+            "Add effects/filters", or the instructions for "Custom edit".
+    """
+    if editing_type == "Background removal":
+        return (
+            "Remove the background from this product image and replace "
+            "it with a clean white background."
+        )
+    elif editing_type == "Change product color":
+        return f"Change the color of this product to {option}."
+    elif editing_type == "Add effects/filters":
+        return f"Apply a {option} effect to this product image."
+    elif editing_type == "Enhance quality":
+        return (
+            "Enhance this product image: increase resolution, improve "
+            "lighting, and make it look professional."
+        )
+    elif editing_type == "Custom edit":
+        return option
+    raise ValueError(f"Unsupported editing type: {editing_type}")
+
+
+def generate_edit(model_provider, model_name, image_size, images, prompt, deadline):
+    """Run a one-off product edit and return the output image and text."""
+    if model_provider == "Google Gemini":
+        if len(images) > 1:
+            response = gemini_multi_image_generation(
+                images, prompt, model=model_name, deadline=deadline
+            )
+        else:
+            response = gemini_image_generation(
+                images[0], prompt, model=model_name, deadline=deadline
+            )
+        return (
+            gemini_extract_response_image(response),
+            gemini_extract_response_text(response),
+        )
+    if len(images) > 1:
+        response = openai_multi_image_generation(
+            images, prompt, model=model_name, size=image_size, deadline=deadline
+        )
+    else:
+        response = openai_image_generation(
+            images[0], prompt, model=model_name, size=image_size, deadline=deadline
+        )
+    return (
+        openai_extract_response_image(response, deadline=deadline),
+        openai_extract_response_text(response),
+    )
+
+
+def sync_speculation(key, cost=0.0, job=None):
+    """Keep this session's background edit in line with the current options.
+
+    A running edit for other options is cancelled. A new one is started for
+    ``key`` unless one was already started for it in this session.
+    """
+    current = st.session_state.get("product_speculation")
+    if current and current.key != key:
+        current.cancel()
+        st.session_state.pop("product_speculation")
+        get_session_memory().drop(current_session_id(), "product_speculation")
+        current = None
+
+    started = st.session_state.setdefault("product_speculated", set())
+    if key is None or current or key in started:
+        return
+    speculation = get_speculator().start(key, cost, job)
+    if speculation:
+        started.add(key)
+        st.session_state["product_speculation"] = speculation
+
+
+def use_speculation(speculation, deadline):
+    """Wait for a background edit started by ``sync_speculation``.
+
+    Returns:
+        The ``(output, text)`` of the background edit, or ``None`` if it
+        failed, timed out or was cancelled and a regular call should be made.
+    """
+    session_id = current_session_id()
+    memory = get_session_memory()
+    try:
+        text = speculation.result(deadline)
+    except Exception:
+        # Only fall back if the background job itself went wrong
+        if deadline.token.cancelled or deadline.remaining() <= 0:
+            raise
+        speculation.cancel()
+        return None
+    output = memory.get_image(session_id, "product_speculation")
+    memory.drop(session_id, "product_speculation")
+    return output, text
+
+
+def refinement_section(state, show_current=True):
+    """Follow-up edits that reuse the conversation behind the last result."""
+    session = state["session"]
+    memory = get_session_memory()
+    session_id = current_session_id()
+
+    st.subheader("Refine Result")
+    current = memory.get_bytes(session_id, "product_result")
+    if current is None:
+        # Dropped after the session sat idle past the memory store's TTL
+        st.info("This refinement session expired. Process the image again.")
+        return
+    if show_current:
+        st.image(
+            current,
+            caption=f"Current result (step {session.turns})",
+            use_container_width=True,
+        )
+
+    instruction = st.text_input(
+        "Follow-up instruction",
+        placeholder="e.g. a bit more shadow, slightly warmer",
+        key="product_refine_instruction",
+    )
+
+    show_cancelled_notice("product_refine")
+
+    if st.button("Apply Refinement", key="product_refine_button") and instruction:
+        deadline = request_deadline("product_refine")
+        with st.spinner("Refining image..."):
+            try:
+                response = session.refine(instruction, deadline=deadline)
+                output_image = session.extract_image(response)
+                output_text = session.extract_text(response)
+
+                if output_image and state["region_box"]:
+                    original = memory.get_image(session_id, "product_original")
+                    output_image = blend_region(
+                        original, output_image, state["region_box"]
+                    )
+
+                if output_image:
+                    memory.put(session_id, "product_result", output_image)
+                    st.image(
+                        output_image,
+                        caption="Refined Product Image",
+                        use_container_width=True,
+                    )
+                    # Not retried: another call would add a turn to the session
+                    problem = check_output(output_image)
+                    if problem:
+                        st.warning(f"This result may be wrong: {problem}.")
+                else:
+                    if output_text:
+                        st.write("**Model Response:**")
+                        st.write(output_text)
+                    else:
+                        st.write("No image was generated.")
+            except Cancelled:
+                st.info("Request cancelled.")
+            except DeadlineExceeded as e:
+                st.error(f"The request timed out: {str(e)}")
+            except Exception as e:
+                st.error(f"Error refining image: {str(e)}")
 
 
 def product_editing_tab():
@@ -27,6 +240,7 @@ def product_editing_tab():
         "Select AI provider", ["Google Gemini", "OpenAI"], key="product_provider"
     )
 
+    image_size = None
     if model_provider == "Google Gemini":
         gemini_models = ["gemini-2.0-flash-preview-image-generation"]
         model_name = st.selectbox(
@@ -40,6 +254,23 @@ def product_editing_tab():
         size_options = ["1024x1024", "1536x1024", "1024x1536"]
         image_size = st.selectbox("Image size", size_options, key="product_size")
 
+    speculate = st.checkbox(
+        "Start the most used edit right after upload",
+        help=(
+            "Runs your team's most common edit in the background as soon as "
+            "an image is uploaded, so it is ready when you click Process. "
+            "Limited by a daily spend cap."
+        ),
+        key="product_speculate",
+    )
+    editing_index = 0
+    if speculate:
+        # Fixed per session so the selection doesn't jump as counts change
+        likely = st.session_state.setdefault(
+            "product_likely_preset", get_speculator().likely(EDITING_TYPES)
+        )
+        editing_index = EDITING_TYPES.index(likely)
+
     # File uploader for main product image
     uploaded_file = st.file_uploader(
         "Upload product image", type=["jpg", "jpeg", "png"], key="product_image"
@@ -47,30 +278,27 @@ def product_editing_tab():
 
     if uploaded_file is not None:
         # Display the uploaded image
+        # Opening only reads the header; pixels are decoded when a region
+        # edit needs them, and the preview is served from the upload itself
         image = PIL.Image.open(uploaded_file)
-        st.image(image, caption="Original Product Image", use_container_width=True)
+        st.image(
+            uploaded_file, caption="Original Product Image", use_container_width=True
+        )
+        file_id = getattr(uploaded_file, "file_id", uploaded_file.name)
 
         # Editing options
         st.subheader("Editing Options")
 
         editing_type = st.selectbox(
             "Select editing operation",
-            [
-                "Background removal",
-                "Replace background",
-                "Change product color",
-                "Add effects/filters",
-                "Enhance quality",
-                "Custom edit",
-            ],
+            EDITING_TYPES,
+            index=editing_index,
+            key="product_editing_type",
         )
 
         # Custom prompt based on editing type
         if editing_type == "Background removal":
-            prompt = (
-                "Remove the background from this product image and replace "
-                "it with a clean white background."
-            )
+            prompt = product_edit_prompt(editing_type)
 
         elif editing_type == "Replace background":
             # Add background image uploader
@@ -82,9 +310,8 @@ def product_editing_tab():
 
             if background_file:
                 # Display the background image
-                background_image = PIL.Image.open(background_file)
                 st.image(
-                    background_image,
+                    background_file,
                     caption="Background Image",
                     use_container_width=True,
                 )
@@ -94,34 +321,19 @@ def product_editing_tab():
                     "it look natural and well-integrated."
                 )
             else:
-                prompt = (
-                    "Remove the background from this product image and "
-                    "replace it with a clean white background."
-                )
+                prompt = product_edit_prompt("Background removal")
                 st.info("Upload a background image to replace the product background.")
 
         elif editing_type == "Change product color":
             color = st.color_picker("Select new color", "#00BFFF")
-            prompt = f"Change the color of this product to {color}."
+            prompt = product_edit_prompt(editing_type, color)
 
         elif editing_type == "Add effects/filters":
-            effect = st.selectbox(
-                "Select effect/filter",
-                [
-                    "soft shadow",
-                    "glossy reflection",
-                    "dramatic lighting",
-                    "studio lighting",
-                    "minimalist",
-                ],
-            )
-            prompt = f"Apply a {effect} effect to this product image."
+            effect = st.selectbox("Select effect/filter", EFFECTS)
+            prompt = product_edit_prompt(editing_type, effect)
 
         elif editing_type == "Enhance quality":
-            prompt = (
-                "Enhance this product image: increase resolution, improve "
-                "lighting, and make it look professional."
-            )
+            prompt = product_edit_prompt(editing_type)
 
         else:  # Custom edit
             prompt = st.text_area(
@@ -142,6 +354,39 @@ def product_editing_tab():
             )
             prompt += f" Output the image in {aspect_ratio} aspect ratio."
 
+        region_box = None
+        if editing_type in REGION_EDIT_TYPES:
+            region_mode = st.checkbox(
+                "Edit only a region",
+                help=(
+                    "Send only the selected area to the model and blend the "
+                    "result back into the full-resolution original."
+                ),
+            )
+            if region_mode:
+                region_source = st.radio(
+                    "Region",
+                    ["Detect product automatically", "Select manually"],
+                    horizontal=True,
+                )
+                if region_source == "Detect product automatically":
+                    # Detected once per upload rather than on every rerun
+                    detected = st.session_state.get("product_detected_box")
+                    if not detected or detected[0] != file_id:
+                        detected = (file_id, detect_product_box(image))
+                        st.session_state["product_detected_box"] = detected
+                    region_box = detected[1]
+                else:
+                    x_range = st.slider("Horizontal range (%)", 0, 100, (10, 90))
+                    y_range = st.slider("Vertical range (%)", 0, 100, (10, 90))
+                    region_box = percent_box(image.size, x_range, y_range)
+                region_box = pad_box(region_box, image.size)
+                st.image(
+                    image.crop(region_box),
+                    caption="Region sent to the model",
+                    use_container_width=True,
+                )
+
         # Additional customization instructions
         st.subheader("Custom Instructions")
         additional_instructions = st.text_area(
@@ -153,15 +398,77 @@ def product_editing_tab():
         if additional_instructions:
             prompt += f" Additionally: {additional_instructions}"
 
+        session_mode = st.checkbox(
+            "Keep a refinement session",
+            help=(
+                "Follow-up instructions continue the same conversation, so "
+                "only the new instruction is sent instead of the full image."
+            ),
+            key="product_session_mode",
+        )
+
+        # Drop the session once a different image is uploaded
+        memory = get_session_memory()
+        session_id = current_session_id()
+        edit_state = st.session_state.get("product_edit_session")
+        if edit_state and edit_state["file_id"] != file_id:
+            st.session_state.pop("product_edit_session")
+            memory.drop(session_id, "product_original")
+            memory.drop(session_id, "product_result")
+            memory.put_group(session_id, "product_session_image_", [])
+            edit_state = None
+
+        # Only the likely preset with untouched options is run ahead of time
+        speculation_key = None
+        if (
+            speculate
+            and editing_type == EDITING_TYPES[editing_index]
+            and editing_type in SPECULATIVE_PRESETS
+            and prompt == product_edit_prompt(editing_type)
+            and not region_box
+            and not session_mode
+        ):
+            speculation_key = (file_id, prompt, model_provider, model_name, image_size)
+        read_upload = uploaded_file.getvalue
+
+        def speculative_edit(deadline):
+            # The result waits in the memory store, not in the future
+            output, text = generate_edit(
+                model_provider,
+                model_name,
+                image_size,
+                [read_upload()],
+                prompt,
+                deadline,
+            )
+            if output is not None:
+                memory.put(session_id, "product_speculation", output)
+            return text
+
+        sync_speculation(
+            speculation_key, ESTIMATED_COST[model_provider], speculative_edit
+        )
+
+        show_cancelled_notice("product")
+
         # Generate button
-        if st.button("Process Product Image"):
+        processed = st.button("Process Product Image")
+        if processed:
+            get_speculator().record_use(editing_type)
+            pending = None
+            if speculation_key:
+                pending = st.session_state.pop("product_speculation", None)
+            deadline = request_deadline("product")
             with st.spinner("Processing image..."):
                 try:
                     # Get image bytes from uploaded file
                     uploaded_file.seek(0)
                     image_bytes = uploaded_file.read()
+                    original_bytes = image_bytes
 
                     # Prepare images list
+                    if region_box:
+                        image_bytes = encode_region(image, region_box)
                     images = [image_bytes]
 
                     if editing_type == "Replace background" and background_file:
@@ -169,29 +476,99 @@ def product_editing_tab():
                         background_bytes = background_file.read()
                         images.append(background_bytes)
 
+                    record_request("product", editing_type, model_provider, images)
+
                     # Call the selected API
-                    if model_provider == "Google Gemini":
-                        if len(images) > 1:
-                            response = gemini_multi_image_generation(
-                                images, prompt, model=model_name
-                            )
-                        else:
-                            response = gemini_image_generation(
-                                images[0], prompt, model=model_name
-                            )
-                        output_image = gemini_extract_response_image(response)
-                        output_text = gemini_extract_response_text(response)
-                    else:  # OpenAI
-                        if len(images) > 1:
-                            response = openai_multi_image_generation(
-                                images, prompt, model=model_name, size=image_size
-                            )
-                        else:
-                            response = openai_image_generation(
-                                images[0], prompt, model=model_name, size=image_size
+                    # (session, output) of each session attempt, so the session
+                    # behind the attempt generate_checked keeps can be found
+                    sessions = []
+
+                    def generate():
+                        if session_mode:
+                            # A retry starts over in a fresh session, with its
+                            # own slot for the latest image
+                            session_image = (
+                                session_id,
+                                f"product_session_image_{len(sessions)}",
                             )
-                        output_image = openai_extract_response_image(response)
-                        output_text = openai_extract_response_text(response)
+                            if model_provider == "Google Gemini":
+                                session = GeminiEditSession(
+                                    model=model_name,
+                                    memory=memory,
+                                    memory_key=session_image,
+                                )
+                            else:
+                                session = OpenAIEditSession(
+                                    image_model=model_name,
+                                    size=image_size,
+                                    memory=memory,
+                                    memory_key=session_image,
+                                )
+                            response = session.start(images, prompt, deadline=deadline)
+                            output = session.extract_image(response)
+                            sessions.append((session, output))
+                            return output, session.extract_text(response)
+                        return generate_edit(
+                            model_provider,
+                            model_name,
+                            image_size,
+                            images,
+                            prompt,
+                            deadline,
+                        )
+
+                    # Proportions the output should have
+                    if image_size:
+                        expected_aspect = parse_aspect(image_size)
+                    elif maintain_proportions:
+                        left, top, right, bottom = region_box or (0, 0, *image.size)
+                        expected_aspect = (right - left) / (bottom - top)
+                    else:
+                        expected_aspect = parse_aspect(aspect_ratio)
+
+                    # The background edit, if any, counts as the first attempt
+                    speculative = (
+                        use_speculation(pending, deadline) if pending else None
+                    )
+                    speculative_output = speculative[0] if speculative else None
+
+                    # Retry outputs that are blank, unchanged or mis-sized
+                    output_image, output_text, problem = generate_checked(
+                        generate,
+                        lambda output: check_output(output, images[0], expected_aspect),
+                        deadline,
+                        first=speculative,
+                    )
+
+                    if session_mode:
+                        # Images live in the session memory store, which
+                        # spills them to disk when the session is over budget
+                        memory.drop(session_id, "product_result")
+                        if region_box:
+                            memory.put(session_id, "product_original", original_bytes)
+                        chosen = next(
+                            index
+                            for index, (_, output) in enumerate(sessions)
+                            if output is output_image
+                        )
+                        for index in range(DEFAULT_MAX_ATTEMPTS):
+                            if index != chosen:
+                                memory.drop(
+                                    session_id, f"product_session_image_{index}"
+                                )
+                        edit_state = {
+                            "session": sessions[chosen][0],
+                            "file_id": file_id,
+                            "region_box": region_box,
+                            "has_result": False,
+                        }
+                        st.session_state["product_edit_session"] = edit_state
+
+                    if output_image and region_box:
+                        output_image = blend_region(image, output_image, region_box)
+                    if output_image and session_mode:
+                        memory.put(session_id, "product_result", output_image)
+                        edit_state["has_result"] = True
 
                     # Display response
                     if output_image:
@@ -200,6 +577,10 @@ def product_editing_tab():
                             caption="Edited Product Image",
                             use_container_width=True,
                         )
+                        if problem:
+                            st.warning(f"This result may be wrong: {problem}.")
+                        if output_image is speculative_output:
+                            st.caption("Started in the background right after upload.")
                     else:
                         if output_text:
                             st.write("**Model Response:**")
@@ -214,6 +595,10 @@ def product_editing_tab():
                             "3. Try a different editing operation"
                         )
                         st.info(tips)
+                except Cancelled:
+                    st.info("Request cancelled.")
+                except DeadlineExceeded as e:
+                    st.error(f"The request timed out: {str(e)}")
                 except Exception as e:
                     st.error(f"Error processing image: {str(e)}")
                     if model_provider == "Google Gemini":
@@ -225,5 +610,9 @@ def product_editing_tab():
                             "Make sure your OpenAI API key is configured correctly."
                         )
                     st.info(api_key_msg)
+
+        if session_mode and edit_state and edit_state["has_result"]:
+            refinement_section(edit_state, show_current=not processed)
     else:
+        sync_speculation(None)
         st.info("Please upload a product image to begin.")
@@ -0,0 +1,96 @@
+import time
+
+import streamlit as st
+
+from app.utils.deadline import (
+    DEFAULT_REQUEST_TIMEOUT,
+    CancelToken,
+    Deadline,
+    get_pool_stats,
+    get_timeout_metrics,
+)
+from app.utils.session_memory import get_session_memory
+
+
+def _mark_cancelled(key):
+    st.session_state[f"{key}_cancelled"] = True
+
+
+def request_deadline(key: str, seconds: float = DEFAULT_REQUEST_TIMEOUT) -> Deadline:
+    """Create a deadline for a request started from a tab.
+
+    Renders a Cancel button and a status line. Pressing Cancel (or closing
+    the session) makes Streamlit stop the running script the next time the
+    status line refreshes, which abandons the in-flight provider call.
+
+    Args:
+        key: Unique prefix for the widgets of the calling tab.
+        seconds: Total time allowed for the request.
+    """
+    st.button("Cancel", key=f"{key}_cancel", on_click=_mark_cancelled, args=(key,))
+    status = st.empty()
+    started = time.monotonic()
+
+    def on_tick():
+        elapsed = time.monotonic() - started
+        status.caption(f"Waiting for the model... {elapsed:.0f}s")
+
+    return Deadline(seconds, token=CancelToken(), on_tick=on_tick)
+
+
+def show_cancelled_notice(key: str):
+    """Tell the user their last request was cancelled, once."""
+    if st.session_state.pop(f"{key}_cancelled", False):
+        st.info("Request cancelled.")
+
+
+def timeout_metrics_view():
+    """Show per-stage latency, timeout and cancellation counters."""
+    pool = get_pool_stats()
+    st.caption(
+        f"Provider pool: {pool['workers']} workers, {pool['running']} running, "
+        f"{pool['queued']} queued."
+    )
+    metrics = get_timeout_metrics()
+    if not metrics:
+        st.caption("No requests yet.")
+        return
+
+    rows = []
+    for stage, values in metrics.items():
+        calls = values["calls"]
+        rows.append(
+            {
+                "stage": stage,
+                "completed": int(calls),
+                "timeouts": int(values["timeouts"]),
+                "cancelled": int(values["cancelled"]),
+                "in flight": int(values["in_flight"]),
+                "mean seconds": (
+                    round(values["total_seconds"] / calls, 2) if calls else None
+                ),
+                "mean queued seconds": (
+                    round(values["queued_seconds"] / calls, 2) if calls else None
+                ),
+            }
+        )
+    st.dataframe(rows, hide_index=True, use_container_width=True)
+
+
+def session_memory_view():
+    """Show images held in memory and on disk, in total and per session."""
+    memory = get_session_memory()
+    memory.sweep()
+    stats = memory.stats()
+
+    col1, col2 = st.columns(2)
+    col1.metric("In memory", f"{stats['resident_bytes'] / 2**20:.1f} MB")
+    col2.metric("Spilled to disk", f"{stats['spilled_bytes'] / 2**20:.1f} MB")
+    st.caption(
+        f"Budget {memory.session_budget / 2**20:.0f} MB per session, "
+        f"{memory.total_budget / 2**20:.0f} MB total. "
+        f"{stats['spill_count']} spills, "
+        f"{stats['evicted_sessions']} expired sessions dropped."
+    )
+    if stats["sessions"]:
+        st.dataframe(stats["sessions"], hide_index=True, use_container_width=True)
@@ -1,5 +1,4 @@
 import streamlit as st
-import PIL.Image
 
 from app.utils.gemini_client import (
     multi_image_generation as gemini_multi_image_generation,
@@ -11,6 +10,10 @@ from app.utils.openai_client import (
     extract_response_image as openai_extract_response_image,
     extract_response_text as openai_extract_response_text,
 )
+from app.components.request_controls import request_deadline, show_cancelled_notice
+from app.utils.deadline import Cancelled, DeadlineExceeded
+from app.utils.output_check import check_output, generate_checked, parse_aspect
+from app.utils.traffic_capture import record_request
 
 
 def style_transfer_tab():
@@ -25,6 +28,7 @@ def style_transfer_tab():
         "Select AI provider", ["Google Gemini", "OpenAI"], key="style_provider"
     )
 
+    image_size = None
     if model_provider == "Google Gemini":
         gemini_models = ["gemini-2.0-flash-preview-image-generation"]
         model_name = st.selectbox(
@@ -50,8 +54,9 @@ def style_transfer_tab():
             key="primary_image_style",
         )
         if primary_file:
-            primary_image = PIL.Image.open(primary_file)
-            st.image(primary_image, caption="Primary Image", use_container_width=True)
+            # Shown from the upload itself; decoding it here would keep a
+            # full-size bitmap around on every rerun
+            st.image(primary_file, caption="Primary Image", use_container_width=True)
 
     with col2:
         secondary_file = st.file_uploader(
@@ -60,9 +65,8 @@ def style_transfer_tab():
             key="secondary_image_style",
         )
         if secondary_file:
-            secondary_image = PIL.Image.open(secondary_file)
             st.image(
-                secondary_image, caption="Reference Image", use_container_width=True
+                secondary_file, caption="Reference Image", use_container_width=True
             )
 
     # Transformation options
@@ -139,9 +143,12 @@ def style_transfer_tab():
         if additional_instructions:
             prompt += f" Additionally: {additional_instructions}"
 
+        show_cancelled_notice("style")
+
         # Generate button
         if st.button("Generate Transformed Image", key="style_button"):
             if primary_file:
+                deadline = request_deadline("style")
                 with st.spinner("Generating image transformation..."):
                     try:
                         # Get image bytes from uploaded files
@@ -155,19 +162,42 @@ def style_transfer_tab():
                             secondary_bytes = secondary_file.read()
                             images.append(secondary_bytes)
 
+                        record_request(
+                            "style", transformation_type, model_provider, images
+                        )
+
                         # Call the selected API
-                        if model_provider == "Google Gemini":
-                            response = gemini_multi_image_generation(
-                                images, prompt, model=model_name
-                            )
-                            output_image = gemini_extract_response_image(response)
-                            output_text = gemini_extract_response_text(response)
-                        else:  # OpenAI
+                        def generate():
+                            if model_provider == "Google Gemini":
+                                response = gemini_multi_image_generation(
+                                    images, prompt, model=model_name, deadline=deadline
+                                )
+                                return (
+                                    gemini_extract_response_image(response),
+                                    gemini_extract_response_text(response),
+                                )
                             response = openai_multi_image_generation(
-                                images, prompt, model=model_name, size=image_size
+                                images,
+                                prompt,
+                                model=model_name,
+                                size=image_size,
+                                deadline=deadline,
+                            )
+                            return (
+                                openai_extract_response_image(
+                                    response, deadline=deadline
+                                ),
+                                openai_extract_response_text(response),
                             )
-                            output_image = openai_extract_response_image(response)
-                            output_text = openai_extract_response_text(response)
+
+                        # Retry outputs that are blank, unchanged or mis-sized
+                        output_image, output_text, problem = generate_checked(
+                            generate,
+                            lambda image: check_output(
+                                image, primary_bytes, parse_aspect(image_size)
+                            ),
+                            deadline,
+                        )
 
                         # Display response
                         if output_image:
@@ -176,6 +206,8 @@ def style_transfer_tab():
                                 caption="Transformed Image",
                                 use_container_width=True,
                             )
+                            if problem:
+                                st.warning(f"This result may be wrong: {problem}.")
                         else:
                             if output_text:
                                 st.write("**Model Response:**")
@@ -191,6 +223,10 @@ def style_transfer_tab():
                             )
                             st.info(tips)
 
+                    except Cancelled:
+                        st.info("Request cancelled.")
+                    except DeadlineExceeded as e:
+                        st.error(f"The request timed out: {str(e)}")
                     except Exception as e:
                         st.error(f"Error generating transformation: {str(e)}")
                         if model_provider == "Google Gemini":
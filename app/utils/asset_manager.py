@@ -0,0 +1,147 @@
+import hashlib
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from io import BytesIO
+from typing import Dict, Optional
+
+from google.genai import types
+
+# Gemini keeps uploaded files for 48 hours
+DEFAULT_FILE_TTL = timedelta(hours=48)
+
+# Re-upload this long before the recorded expiry so a request never
+# references a file that disappears while it is in flight
+EXPIRY_MARGIN = timedelta(minutes=30)
+
+# Uploads are serialized per digest through a fixed set of locks, so the
+# number of locks does not grow with the number of distinct images
+UPLOAD_LOCK_STRIPES = 64
+
+
+@dataclass
+class UploadedAsset:
+    """A reference image stored with the Files API."""
+
+    digest: str
+    uri: str
+    mime_type: str
+    expires_at: datetime
+
+    def is_expired(self, now: Optional[datetime] = None) -> bool:
+        now = now or datetime.now(timezone.utc)
+        return now >= self.expires_at - EXPIRY_MARGIN
+
+
+def guess_mime_type(data: bytes) -> str:
+    """Guess an image MIME type from its leading bytes."""
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    if data.startswith((b"GIF87a", b"GIF89a")):
+        return "image/gif"
+    return "image/jpeg"
+
+
+class AssetManager:
+    """Upload reference images once and reuse their Files API URIs.
+
+    Assets are keyed by the SHA-256 of their bytes, so the same clothing or
+    background image uploaded in different sessions maps to a single file.
+    Expired entries are dropped and uploaded again transparently.
+
+    Args:
+        files: The ``files`` namespace of a ``genai.Client`` (or a local
+            stand-in such as ``FakeFilesAPI``).
+    """
+
+    def __init__(self, files):
+        self._files = files
+        self._assets: Dict[str, UploadedAsset] = {}
+        self._lock = threading.Lock()
+        self._upload_locks = [threading.Lock() for _ in range(UPLOAD_LOCK_STRIPES)]
+
+    def get_part(
+        self,
+        data: bytes,
+        mime_type: Optional[str] = None,
+        timeout: Optional[float] = None,
+    ) -> types.Part:
+        """Return a ``Part`` referencing ``data``, uploading it if needed."""
+        asset = self.get_asset(data, mime_type, timeout=timeout)
+        return types.Part.from_uri(file_uri=asset.uri, mime_type=asset.mime_type)
+
+    def get_asset(
+        self,
+        data: bytes,
+        mime_type: Optional[str] = None,
+        timeout: Optional[float] = None,
+    ) -> UploadedAsset:
+        """Return the uploaded asset for ``data``, uploading it if needed.
+
+        Args:
+            data: Encoded image bytes.
+            mime_type: MIME type of ``data``; guessed from its header if unset.
+            timeout: Upload timeout in seconds.
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        upload_lock = self._upload_locks[int(digest[:8], 16) % UPLOAD_LOCK_STRIPES]
+
+        # Only one thread uploads a given asset; the others wait for its URI.
+        # Uploads of other digests that share the stripe wait as well.
+        with upload_lock:
+            with self._lock:
+                asset = self._assets.get(digest)
+                if asset is not None and asset.is_expired():
+                    del self._assets[digest]
+                    asset = None
+            if asset is None:
+                asset = self._upload(
+                    digest, data, mime_type or guess_mime_type(data), timeout
+                )
+                with self._lock:
+                    self._drop_expired()
+                    self._assets[digest] = asset
+            return asset
+
+    def invalidate(self, data: bytes):
+        """Forget the upload for ``data`` so the next use uploads it again."""
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            self._assets.pop(digest, None)
+
+    def _drop_expired(self):
+        # Called with the lock held, whenever an upload adds an entry
+        now = datetime.now(timezone.utc)
+        for digest in [d for d, a in self._assets.items() if a.is_expired(now)]:
+            del self._assets[digest]
+
+    def _upload(
+        self, digest: str, data: bytes, mime_type: str, timeout: Optional[float]
+    ) -> UploadedAsset:
+        http_options = None
+        if timeout is not None:
+            http_options = types.HttpOptions(timeout=int(timeout * 1000))
+
+        uploaded = self._files.upload(
+            file=BytesIO(data),
+            config=types.UploadFileConfig(
+                mime_type=mime_type,
+                display_name=f"asset-{digest[:16]}",
+                http_options=http_options,
+            ),
+        )
+
+        expires_at = getattr(uploaded, "expiration_time", None)
+        if expires_at is None:
+            expires_at = datetime.now(timezone.utc) + DEFAULT_FILE_TTL
+        elif expires_at.tzinfo is None:
+            expires_at = expires_at.replace(tzinfo=timezone.utc)
+
+        return UploadedAsset(
+            digest=digest,
+            uri=uploaded.uri,
+            mime_type=uploaded.mime_type or mime_type,
+            expires_at=expires_at,
+        )
@@ -0,0 +1,331 @@
+import base64
+import json
+import time
+import uuid
+from dataclasses import dataclass
+from io import BytesIO
+from types import SimpleNamespace
+from typing import Dict, Iterator, List, Optional
+
+import PIL.Image
+from google.genai import types
+
+from app.utils import gemini_client, openai_client
+from app.utils.asset_manager import guess_mime_type
+
+
+@dataclass
+class BatchRequest:
+    """One (images, prompt) edit submitted as part of a provider batch."""
+
+    key: str
+    images: List
+    prompt: str
+    attempts: int = 0
+
+
+@dataclass
+class BatchResult:
+    """Outcome of a batch request once it has succeeded or run out of retries."""
+
+    key: str
+    image: Optional[PIL.Image.Image]
+    text: Optional[str] = None
+    error: Optional[str] = None
+    attempts: int = 0
+
+
+class GeminiBatchBackend:
+    """Submit requests through the Gemini Batch API.
+
+    Requests are written to a JSONL file that is uploaded through the Files
+    API and passed to the job as its source, because inlined requests are
+    limited to about 20 MB per job. Results are read back from the job's
+    output file.
+
+    Args:
+        client: A ``genai.Client`` (or a local stand-in such as
+            ``FakeGeminiBatchClient``); its ``files`` and ``batches`` are used.
+        model: Gemini model used for every request in the batch.
+    """
+
+    terminal_states = {
+        "JOB_STATE_SUCCEEDED",
+        "JOB_STATE_FAILED",
+        "JOB_STATE_CANCELLED",
+        "JOB_STATE_EXPIRED",
+    }
+
+    def __init__(self, client, model="gemini-2.0-flash-preview-image-generation"):
+        self.client = client
+        self.model = model
+        self._input_files: Dict[str, str] = {}
+
+    def submit(self, requests: List[BatchRequest]) -> str:
+        lines = []
+        for request in requests:
+            parts = [{"text": request.prompt}]
+            for image in request.images:
+                # The OpenAI helper returns encoded bytes for every input type
+                data = openai_client.process_image(image)
+                parts.append(
+                    {
+                        "inline_data": {
+                            "mime_type": guess_mime_type(data),
+                            "data": base64.b64encode(data).decode("ascii"),
+                        }
+                    }
+                )
+            lines.append(
+                json.dumps(
+                    {
+                        "key": request.key,
+                        "request": {
+                            "contents": [{"role": "user", "parts": parts}],
+                            "generation_config": {
+                                "response_modalities": ["TEXT", "IMAGE"]
+                            },
+                        },
+                    }
+                )
+            )
+
+        display_name = f"image-edits-{uuid.uuid4().hex[:8]}"
+        batch_file = self.client.files.upload(
+            file=BytesIO("\n".join(lines).encode("utf-8")),
+            config=types.UploadFileConfig(
+                mime_type="jsonl", display_name=f"{display_name}.jsonl"
+            ),
+        )
+        job = self.client.batches.create(
+            model=self.model, src=batch_file.name, config={"display_name": display_name}
+        )
+        self._input_files[job.name] = batch_file.name
+        return job.name
+
+    def poll(self, job_id: str) -> bool:
+        job = self.client.batches.get(name=job_id)
+        return job.state.name in self.terminal_states
+
+    def results(self, job_id: str) -> Iterator[tuple]:
+        job = self.client.batches.get(name=job_id)
+        input_file = self._input_files.pop(job_id, None)
+        if input_file:
+            # The request file is only needed until the job has finished
+            try:
+                self.client.files.delete(name=input_file)
+            except Exception:
+                pass
+        if job.state.name != "JOB_STATE_SUCCEEDED" or not job.dest:
+            return
+
+        content = self.client.files.download(file=job.dest.file_name)
+        for line in content.decode("utf-8").splitlines():
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if record.get("error") or not record.get("response"):
+                yield record["key"], None, str(record.get("error"))
+            else:
+                yield record["key"], _gemini_response(record["response"]), None
+
+    def extract_image(self, response):
+        return gemini_client.extract_response_image(response)
+
+    def extract_text(self, response):
+        return gemini_client.extract_response_text(response)
+
+
+def _gemini_response(body: Dict):
+    """Shape a JSON ``GenerateContentResponse`` like an SDK response.
+
+    Output files use the REST field names (``inlineData``, ``mimeType``) with
+    base64 image data.
+    """
+    candidates = []
+    for candidate in body.get("candidates") or []:
+        parts = []
+        for part in (candidate.get("content") or {}).get("parts") or []:
+            blob = part.get("inlineData") or part.get("inline_data")
+            inline_data = None
+            if blob:
+                inline_data = SimpleNamespace(
+                    mime_type=blob.get("mimeType") or blob.get("mime_type"),
+                    data=base64.b64decode(blob["data"]),
+                )
+            parts.append(
+                SimpleNamespace(text=part.get("text"), inline_data=inline_data)
+            )
+        candidates.append(SimpleNamespace(content=SimpleNamespace(parts=parts)))
+    return SimpleNamespace(candidates=candidates)
+
+
+class OpenAIBatchBackend:
+    """Submit requests through the OpenAI Batch API.
+
+    Requests are written to a JSONL file targeting ``/v1/images/edits`` with
+    the input images embedded as data URLs.
+
+    Args:
+        client: An ``OpenAI`` client.
+        model: OpenAI image model used for every request in the batch.
+        size: Output size for every request in the batch.
+    """
+
+    endpoint = "/v1/images/edits"
+    terminal_states = {"completed", "failed", "expired", "cancelled"}
+
+    def __init__(self, client, model="gpt-image-1", size="1024x1024"):
+        self.client = client
+        self.model = model
+        self.size = size
+
+    def submit(self, requests: List[BatchRequest]) -> str:
+        lines = []
+        for request in requests:
+            images = []
+            for image in request.images:
+                data = openai_client.process_image(image)
+                encoded = base64.b64encode(data).decode("ascii")
+                images.append(
+                    {"image_url": f"data:{guess_mime_type(data)};base64,{encoded}"}
+                )
+            lines.append(
+                json.dumps(
+                    {
+                        "custom_id": request.key,
+                        "method": "POST",
+                        "url": self.endpoint,
+                        "body": {
+                            "model": self.model,
+                            "prompt": request.prompt,
+                            "size": self.size,
+                            "images": images,
+                        },
+                    }
+                )
+            )
+
+        batch_file = self.client.files.create(
+            file=("batch.jsonl", "\n".join(lines).encode("utf-8")), purpose="batch"
+        )
+        batch = self.client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint=self.endpoint,
+            completion_window="24h",
+        )
+        return batch.id
+
+    def poll(self, job_id: str) -> bool:
+        return self.client.batches.retrieve(job_id).status in self.terminal_states
+
+    def results(self, job_id: str) -> Iterator[tuple]:
+        batch = self.client.batches.retrieve(job_id)
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            for line in self.client.files.content(file_id).text.splitlines():
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                response = record.get("response") or {}
+                if record.get("error") or response.get("status_code") != 200:
+                    error = record.get("error") or response.get("body")
+                    yield record["custom_id"], None, str(error)
+                    continue
+                # Shape the body like an SDK response for extract_response_image
+                body = response["body"]
+                data = [SimpleNamespace(**item) for item in body.get("data", [])]
+                yield record["custom_id"], SimpleNamespace(data=data), None
+
+    def extract_image(self, response):
+        return openai_client.extract_response_image(response)
+
+    def extract_text(self, response):
+        return openai_client.extract_response_text(response)
+
+
+def run_batch(
+    requests: List[BatchRequest],
+    backend,
+    chunk_size: int = 100,
+    max_attempts: int = 3,
+    poll_interval: float = 5.0,
+    max_poll_interval: float = 120.0,
+) -> Iterator[BatchResult]:
+    """Run requests through a provider batch backend.
+
+    Requests are packed into batches of ``chunk_size`` and submitted together.
+    Jobs are polled with exponential backoff and results are yielded as soon
+    as each job finishes. Requests that fail, produce no image, or are missing
+    from a finished job are requeued until ``max_attempts`` is reached.
+
+    Args:
+        requests: The requests to run. Keys must be unique.
+        backend: A ``GeminiBatchBackend`` or ``OpenAIBatchBackend``.
+        chunk_size: Maximum number of requests per submitted batch.
+        max_attempts: Attempts per request before it is reported as failed.
+        poll_interval: Initial delay between status checks, in seconds.
+        max_poll_interval: Upper bound for the backoff delay, in seconds.
+
+    Yields:
+        A ``BatchResult`` for every request.
+    """
+    by_key = {request.key: request for request in requests}
+    if len(by_key) != len(requests):
+        raise ValueError("Batch request keys must be unique.")
+
+    queue = list(requests)
+    while queue:
+        # Submit everything that is waiting, one job per chunk
+        jobs = {}
+        for start in range(0, len(queue), chunk_size):
+            chunk = queue[start : start + chunk_size]
+            for request in chunk:
+                request.attempts += 1
+            jobs[backend.submit(chunk)] = {request.key for request in chunk}
+        queue = []
+
+        delay = poll_interval
+        while jobs:
+            time.sleep(delay)
+            for job_id in [job_id for job_id in jobs if backend.poll(job_id)]:
+                outstanding = jobs.pop(job_id)
+                for key, response, error in backend.results(job_id):
+                    if key not in outstanding:
+                        continue
+                    outstanding.discard(key)
+                    request = by_key[key]
+
+                    image = backend.extract_image(response) if response else None
+                    if image is not None:
+                        yield BatchResult(
+                            key=key,
+                            image=image,
+                            text=backend.extract_text(response),
+                            attempts=request.attempts,
+                        )
+                    elif request.attempts < max_attempts:
+                        queue.append(request)
+                    else:
+                        yield BatchResult(
+                            key=key,
+                            image=None,
+                            text=backend.extract_text(response) if response else None,
+                            error=error or "No image was generated.",
+                            attempts=request.attempts,
+                        )
+
+                # Anything the provider dropped from a finished job is retried
+                for key in outstanding:
+                    request = by_key[key]
+                    if request.attempts < max_attempts:
+                        queue.append(request)
+                    else:
+                        yield BatchResult(
+                            key=key,
+                            image=None,
+                            error="Missing from batch results.",
+                            attempts=request.attempts,
+                        )
+            delay = min(delay * 2, max_poll_interval)
@@ -0,0 +1,328 @@
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Callable, Dict, List, Optional, Sequence, Union
+
+# Default end-to-end budget for one user request, in seconds
+DEFAULT_REQUEST_TIMEOUT = 180.0
+
+# Upper bound for each stage of the request path, in seconds. A stage gets
+# the smaller of its own budget and whatever is left of the overall deadline.
+STAGE_BUDGETS = {
+    "fetch": 20.0,
+    "upload": 30.0,
+    "prepare": 45.0,
+    "generate": 150.0,
+    "download": 20.0,
+}
+
+# How often waiting callers check for cancellation, in seconds
+POLL_INTERVAL = 0.25
+
+# Inputs of one request prepared at the same time by map_with_deadline
+PREPARE_WORKERS = 4
+
+# Provider calls of all sessions run on one pool so the caller can stop
+# waiting on them. An abandoned call keeps its worker until the SDK's own
+# timeout fires.
+PROVIDER_CALL_WORKERS = int(os.getenv("PROVIDER_CALL_WORKERS", "32"))
+
+_executor = ThreadPoolExecutor(
+    max_workers=PROVIDER_CALL_WORKERS, thread_name_prefix="provider-call"
+)
+_pool_lock = threading.Lock()
+_pool = {"workers": PROVIDER_CALL_WORKERS, "running": 0, "queued": 0}
+
+_metrics_lock = threading.Lock()
+_metrics: Dict[str, Dict[str, float]] = {}
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a request runs out of time."""
+
+
+class Cancelled(Exception):
+    """Raised when a request is cancelled by the user or its session ends."""
+
+
+class CancelToken:
+    """Thread-safe flag used to cancel in-flight work cooperatively."""
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+
+class Deadline:
+    """Time budget for one request, propagated through every stage.
+
+    Args:
+        seconds: Total time allowed for the request.
+        token: Token that cancels the request when set.
+        on_tick: Called periodically while waiting on a provider. Streamlit
+            components use it to refresh a status line, which also lets
+            Streamlit interrupt the wait when the session reruns or ends.
+    """
+
+    def __init__(
+        self,
+        seconds: float = DEFAULT_REQUEST_TIMEOUT,
+        token: Optional[CancelToken] = None,
+        on_tick: Optional[Callable[[], None]] = None,
+    ):
+        self.expires_at = time.monotonic() + seconds
+        self.token = token or CancelToken()
+        self.on_tick = on_tick
+
+    def remaining(self) -> float:
+        return self.expires_at - time.monotonic()
+
+    def check(self, stage: str):
+        """Raise if the request was cancelled or has no time left."""
+        if self.token.cancelled:
+            _record(stage, "cancelled")
+            raise Cancelled(f"Request cancelled before {stage}.")
+        if self.remaining() <= 0:
+            _record(stage, "timeouts")
+            raise DeadlineExceeded(f"Deadline exceeded before {stage}.")
+
+    def budget(self, stage: str) -> float:
+        """Return the seconds available for ``stage``."""
+        self.check(stage)
+        return min(STAGE_BUDGETS[stage], self.remaining())
+
+    def for_worker(self) -> "Deadline":
+        """Same budget and token, without ``on_tick``.
+
+        Streamlit elements can only be updated from the script thread, so
+        work handed to other threads must not call ``on_tick``.
+        """
+        worker = Deadline(0, token=self.token)
+        worker.expires_at = self.expires_at
+        return worker
+
+
+def set_provider_workers(workers: int):
+    """Replace the provider call pool with one of ``workers`` threads.
+
+    Used by bulk runs whose ``--concurrency`` exceeds the default pool, which
+    would otherwise cap them silently. Calls already queued still run.
+    """
+    global _executor
+    with _pool_lock:
+        previous = _executor
+        _executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="provider-call"
+        )
+        _pool["workers"] = workers
+    previous.shutdown(wait=False)
+
+
+def _submit(stage: str, deadline: Deadline, fn, args, kwargs):
+    """Queue ``fn`` on the provider pool.
+
+    The stage budget is worked out when a worker picks the call up, not when
+    it is queued, so a busy pool does not eat into the provider's own time.
+    Returns the future and a dict that gets ``started`` and ``timeout`` then.
+    """
+    task = {"submitted": time.monotonic()}
+
+    def run():
+        with _pool_lock:
+            _pool["queued"] -= 1
+            _pool["running"] += 1
+        try:
+            task["timeout"] = min(STAGE_BUDGETS[stage], deadline.remaining())
+            task["started"] = time.monotonic()
+            if deadline.token.cancelled:
+                raise Cancelled(f"Request cancelled before {stage}.")
+            if task["timeout"] <= 0:
+                raise DeadlineExceeded(f"{stage} timed out waiting for a free worker.")
+            return fn(*args, timeout=task["timeout"], **kwargs)
+        finally:
+            with _pool_lock:
+                _pool["running"] -= 1
+
+    def release_if_cancelled(future):
+        # A call cancelled while still queued never reaches run()
+        if future.cancelled():
+            with _pool_lock:
+                _pool["queued"] -= 1
+
+    with _pool_lock:
+        _pool["queued"] += 1
+        future = _executor.submit(run)
+    future.add_done_callback(release_if_cancelled)
+    return future, task
+
+
+def _wait(stage: str, deadline: Deadline, future: Future, task: Dict[str, float]):
+    """Poll ``future`` until it finishes, the budget runs out or it is cancelled.
+
+    Until ``task`` has a ``started`` time the call is only bounded by the
+    overall deadline; after that by its own ``timeout``.
+    """
+    while True:
+        if deadline.token.cancelled:
+            _record(stage, "cancelled")
+            raise Cancelled(f"Request cancelled during {stage}.")
+        started = task.get("started")
+        if started is None:
+            wait = min(POLL_INTERVAL, deadline.remaining())
+            if wait <= 0:
+                _record(stage, "timeouts")
+                raise DeadlineExceeded(f"{stage} timed out waiting for a free worker.")
+        else:
+            timeout = task["timeout"]
+            wait = min(POLL_INTERVAL, timeout - (time.monotonic() - started))
+            if wait <= 0:
+                _record(stage, "timeouts")
+                raise DeadlineExceeded(f"{stage} timed out after {timeout:.1f}s.")
+        try:
+            return future.result(timeout=wait)
+        except FutureTimeoutError:
+            if deadline.on_tick:
+                deadline.on_tick()
+
+
+def _abandon(deadline: Deadline, futures: List[Future], error: BaseException):
+    for future in futures:
+        future.cancel()
+    if not isinstance(error, Exception):
+        # Streamlit stops the script when the session reruns (e.g. the Cancel
+        # button was pressed) or disconnects: abandon the rest of the request
+        deadline.token.cancel()
+
+
+def call_with_deadline(stage: str, deadline: Optional[Deadline], fn, *args, **kwargs):
+    """Run ``fn(*args, timeout=..., **kwargs)`` within the stage budget.
+
+    ``fn`` receives the stage budget as ``timeout`` so the underlying HTTP
+    call can give up on its own. The budget starts when a pool worker picks
+    the call up; while it is queued only the overall deadline applies. The
+    caller stops waiting as soon as the budget runs out or the deadline's
+    token is cancelled.
+
+    Raises:
+        DeadlineExceeded: If the stage budget runs out.
+        Cancelled: If the token is cancelled while waiting.
+    """
+    deadline = deadline or Deadline()
+    deadline.check(stage)
+    future, task = _submit(stage, deadline, fn, args, kwargs)
+    _record(stage, "in_flight", 1)
+
+    try:
+        result = _wait(stage, deadline, future, task)
+        _record(stage, "calls")
+        _record(stage, "queued_seconds", task["started"] - task["submitted"])
+        _record(stage, "total_seconds", time.monotonic() - task["started"])
+        return result
+    except BaseException as e:
+        _abandon(deadline, [future], e)
+        raise
+    finally:
+        _record(stage, "in_flight", -1)
+
+
+def wait_with_deadline(stage: str, deadline: Optional[Deadline], future: Future):
+    """Wait for a future started elsewhere, within the stage budget.
+
+    Unlike ``call_with_deadline`` this does not take a provider worker, and
+    ``future`` is left running if the wait gives up.
+    """
+    deadline = deadline or Deadline()
+    task = {"timeout": deadline.budget(stage), "started": time.monotonic()}
+    _record(stage, "in_flight", 1)
+
+    try:
+        result = _wait(stage, deadline, future, task)
+        _record(stage, "calls")
+        _record(stage, "total_seconds", time.monotonic() - task["started"])
+        return result
+    except BaseException as e:
+        _abandon(deadline, [], e)
+        raise
+    finally:
+        _record(stage, "in_flight", -1)
+
+
+def map_with_deadline(
+    stage: str,
+    deadline: Optional[Deadline],
+    fn: Union[Callable, Sequence[Callable]],
+    items: List,
+) -> List:
+    """Run ``fn(item, deadline)`` for every item concurrently.
+
+    ``fn`` is either one callable or one callable per item. A single item
+    runs directly on the calling thread. Otherwise the items are spread over
+    a small pool of their own, so that provider calls they make do not queue
+    behind them, while the caller waits within the stage budget.
+    """
+    deadline = deadline or Deadline()
+    fns = list(fn) if isinstance(fn, (list, tuple)) else [fn] * len(items)
+    if len(items) <= 1:
+        return [f(item, deadline) for f, item in zip(fns, items)]
+
+    worker_deadline = deadline.for_worker()
+    task = {"timeout": deadline.budget(stage), "started": time.monotonic()}
+    pool = ThreadPoolExecutor(
+        max_workers=min(PREPARE_WORKERS, len(items)), thread_name_prefix=stage
+    )
+    futures = [pool.submit(f, item, worker_deadline) for f, item in zip(fns, items)]
+    # The threads exit once their items are done, even if nobody waits
+    pool.shutdown(wait=False)
+    _record(stage, "in_flight", 1)
+
+    try:
+        results = [_wait(stage, deadline, future, task) for future in futures]
+        _record(stage, "calls")
+        _record(stage, "total_seconds", time.monotonic() - task["started"])
+        return results
+    except BaseException as e:
+        _abandon(deadline, futures, e)
+        raise
+    finally:
+        _record(stage, "in_flight", -1)
+
+
+def _record(stage: str, name: str, amount: float = 1):
+    with _metrics_lock:
+        stage_metrics = _metrics.setdefault(
+            stage,
+            {
+                "calls": 0,
+                "timeouts": 0,
+                "cancelled": 0,
+                "in_flight": 0,
+                "queued_seconds": 0.0,
+                "total_seconds": 0.0,
+            },
+        )
+        stage_metrics[name] += amount
+
+
+def get_timeout_metrics() -> Dict[str, Dict[str, float]]:
+    """Return per-stage call, timeout and cancellation counters.
+
+    ``calls``, ``queued_seconds`` and ``total_seconds`` only count completed
+    calls, so ``total_seconds / calls`` is the mean latency of a stage and
+    ``queued_seconds / calls`` the mean wait for a provider worker.
+    """
+    with _metrics_lock:
+        return {stage: dict(values) for stage, values in _metrics.items()}
+
+
+def get_pool_stats() -> Dict[str, int]:
+    """Return the provider pool size and how many calls run or wait in it."""
+    with _pool_lock:
+        return dict(_pool)
@@ -0,0 +1,270 @@
+import base64
+from types import SimpleNamespace
+from typing import List, Optional, Tuple
+
+from google import genai
+from google.genai import types
+from openai import OpenAI
+
+from app.utils import gemini_client, openai_client
+from app.utils.asset_manager import guess_mime_type
+from app.utils.deadline import Deadline, call_with_deadline
+from app.utils.session_memory import SessionMemory
+
+# Exchanges kept in a session before older context is dropped
+DEFAULT_MAX_TURNS = 4
+
+# Stands in for images dropped from the history
+OMITTED_IMAGE_TEXT = "[earlier image omitted]"
+
+
+def _omit_image(part: types.Part) -> types.Part:
+    if part.inline_data:
+        return types.Part(text=OMITTED_IMAGE_TEXT)
+    return part
+
+
+class _LatestImage:
+    """A session's latest output, held in ``memory`` when one is given."""
+
+    def __init__(
+        self,
+        memory: Optional[SessionMemory] = None,
+        key: Optional[Tuple[str, str]] = None,
+    ):
+        self._memory = memory
+        self._key = key
+        self._data: Optional[bytes] = None
+
+    def put(self, data: bytes):
+        if self._memory is not None:
+            self._memory.put(*self._key, data)
+        else:
+            self._data = data
+
+    def get(self) -> Optional[bytes]:
+        if self._memory is not None:
+            return self._memory.get_bytes(*self._key)
+        return self._data
+
+
+class GeminiEditSession:
+    """Iterative edits on one image through a Gemini chat.
+
+    The first call sends the images and the full prompt; follow-ups send only
+    the new instruction and rely on the chat history for the previous output.
+    After every turn the history is compacted: only the latest output image
+    is kept, and at most ``max_turns`` exchanges are replayed. Between turns
+    the latest image lives in ``memory`` rather than in the history.
+
+    Args:
+        model: Gemini image model.
+        max_turns: Exchanges kept in the history.
+        memory: Store holding the latest image between turns; without one
+            it is kept on the session object.
+        memory_key: ``(session, name)`` of the latest image in ``memory``.
+    """
+
+    def __init__(
+        self,
+        model="gemini-2.0-flash-preview-image-generation",
+        max_turns=DEFAULT_MAX_TURNS,
+        memory: Optional[SessionMemory] = None,
+        memory_key: Optional[Tuple[str, str]] = None,
+    ):
+        self.model = model
+        self.max_turns = max_turns
+        self.turns = 0
+        self._client = genai.Client(api_key=gemini_client.get_api_key())
+        self._config = types.GenerateContentConfig(
+            response_modalities=["Text", "Image"]
+        )
+        self._history: List[types.Content] = []
+        # Where the latest image belongs in the history, and its MIME type
+        self._latest_at: Optional[Tuple[int, int]] = None
+        self._latest_mime = "image/png"
+        self._latest = _LatestImage(memory, memory_key)
+
+    def start(self, images: List, prompt: str, deadline: Deadline = None):
+        """Send the initial edit with its source images."""
+        deadline = deadline or Deadline()
+        parts = [gemini_client.process_image(image, deadline) for image in images]
+        return self._send([prompt, *parts], deadline)
+
+    def refine(self, instruction: str, deadline: Deadline = None):
+        """Apply a follow-up instruction to the latest output."""
+        return self._send(instruction, deadline or Deadline())
+
+    def extract_image(self, response):
+        return gemini_client.extract_response_image(response)
+
+    def extract_text(self, response):
+        return gemini_client.extract_response_text(response)
+
+    def _send(self, message, deadline: Deadline):
+        chat = self._client.chats.create(
+            model=self.model, config=self._config, history=self._restore_history()
+        )
+
+        def send(timeout):
+            config = self._config.model_copy(
+                update={"http_options": types.HttpOptions(timeout=int(timeout * 1000))}
+            )
+            return chat.send_message(message, config=config)
+
+        response = call_with_deadline("generate", deadline, send)
+        self.turns += 1
+        self._compact_history(chat.get_history(curated=True))
+        return response
+
+    def _restore_history(self) -> List[types.Content]:
+        """The compacted history with the latest image put back in place."""
+        if self._latest_at is None:
+            return self._history
+        data = self._latest.get()
+        if data is None:
+            # Dropped from memory, e.g. after the session sat idle
+            return self._history
+        content_index, part_index = self._latest_at
+        history = list(self._history)
+        parts = list(history[content_index].parts)
+        parts[part_index] = types.Part.from_bytes(
+            data=data, mime_type=self._latest_mime
+        )
+        history[content_index] = types.Content(
+            role=history[content_index].role, parts=parts
+        )
+        return history
+
+    def _compact_history(self, history: List[types.Content]):
+        # Keep whole exchanges so the history still starts with a user turn
+        history = history[-2 * self.max_turns :]
+
+        latest_image = None
+        for index in range(len(history) - 1, -1, -1):
+            if any(part.inline_data for part in history[index].parts or []):
+                latest_image = index
+                break
+
+        compacted = []
+        self._latest_at = None
+        for index, content in enumerate(history):
+            parts = [_omit_image(part) for part in content.parts or []]
+            if index == latest_image:
+                # Follow-ups edit the model's last image, or the user's first
+                # (the source) if the model has not returned one yet
+                indexes = [
+                    i for i, part in enumerate(content.parts) if part.inline_data
+                ]
+                part_index = indexes[-1] if content.role == "model" else indexes[0]
+                inline = content.parts[part_index].inline_data
+                self._latest.put(inline.data)
+                self._latest_mime = inline.mime_type or "image/png"
+                self._latest_at = (index, part_index)
+            compacted.append(types.Content(role=content.role, parts=parts))
+        self._history = compacted
+
+
+class OpenAIEditSession:
+    """Iterative edits on one image through chained OpenAI responses.
+
+    Uses the Responses API with the ``image_generation`` tool. Follow-ups send
+    only the new instruction with ``previous_response_id``, so the previous
+    output stays on the server. After ``max_turns`` follow-ups a new chain is
+    started from the latest output to keep the server-side context bounded.
+
+    Args:
+        model: Mainline model driving the image generation tool.
+        image_model: Image model the tool generates with.
+        size: Output image size.
+        max_turns: Follow-ups before the chain is restarted.
+        memory: Store holding the latest output for chain restarts; without
+            one it is kept on the session object.
+        memory_key: ``(session, name)`` of the latest output in ``memory``.
+    """
+
+    def __init__(
+        self,
+        model="gpt-4.1-mini",
+        image_model="gpt-image-1",
+        size="1024x1024",
+        max_turns=DEFAULT_MAX_TURNS,
+        memory: Optional[SessionMemory] = None,
+        memory_key: Optional[Tuple[str, str]] = None,
+    ):
+        self.model = model
+        self.image_model = image_model
+        self.size = size
+        self.max_turns = max_turns
+        self.turns = 0
+        self._client = OpenAI(api_key=openai_client.get_api_key())
+        self._previous_id: Optional[str] = None
+        self._chain_turns = 0
+        self._latest = _LatestImage(memory, memory_key)
+
+    def start(self, images: List, prompt: str, deadline: Deadline = None):
+        """Send the initial edit with its source images."""
+        deadline = deadline or Deadline()
+        data = [openai_client.process_image(image, deadline) for image in images]
+        return self._send(prompt, data, None, deadline)
+
+    def refine(self, instruction: str, deadline: Deadline = None):
+        """Apply a follow-up instruction to the latest output."""
+        deadline = deadline or Deadline()
+        latest = self._latest.get() if self._chain_turns >= self.max_turns else None
+        if latest:
+            # Start a fresh chain that only carries the latest output
+            return self._send(instruction, [latest], None, deadline)
+        return self._send(instruction, [], self._previous_id, deadline)
+
+    def extract_image(self, response):
+        return openai_client.extract_response_image(response)
+
+    def extract_text(self, response):
+        return openai_client.extract_response_text(response)
+
+    def _send(self, text, images, previous_id, deadline: Deadline):
+        content = [{"type": "input_text", "text": text}]
+        for data in images:
+            encoded = base64.b64encode(data).decode("ascii")
+            content.append(
+                {
+                    "type": "input_image",
+                    "image_url": f"data:{guess_mime_type(data)};base64,{encoded}",
+                }
+            )
+
+        kwargs = {}
+        if previous_id:
+            kwargs["previous_response_id"] = previous_id
+
+        response = call_with_deadline(
+            "generate",
+            deadline,
+            self._client.responses.create,
+            model=self.model,
+            input=[{"role": "user", "content": content}],
+            tools=[
+                {
+                    "type": "image_generation",
+                    "model": self.image_model,
+                    "size": self.size,
+                }
+            ],
+            **kwargs,
+        )
+        self.turns += 1
+        self._previous_id = response.id
+        self._chain_turns = 0 if previous_id is None else self._chain_turns + 1
+
+        results = [
+            item.result
+            for item in response.output
+            if item.type == "image_generation_call" and item.result
+        ]
+        if results:
+            self._latest.put(base64.b64decode(results[-1]))
+        # Shape the output like an Images API response for extract_response_image
+        return SimpleNamespace(
+            data=[SimpleNamespace(b64_json=result, url=None) for result in results[-1:]]
+        )
@@ -0,0 +1,413 @@
+import base64
+import itertools
+import json
+import math
+import os
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from types import SimpleNamespace
+from typing import Dict
+
+import PIL.Image
+
+from app.utils.asset_manager import guess_mime_type
+
+
+class FakeFilesAPI:
+    """In-memory stand-in for the Gemini Files API (``client.files``).
+
+    Args:
+        ttl: How long uploaded files stay valid.
+    """
+
+    def __init__(self, ttl: timedelta = timedelta(hours=48)):
+        self.ttl = ttl
+        self.files = {}
+        self.upload_count = 0
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def upload(self, file, config=None):
+        """Store the file and return a ``File``-like record."""
+        data = file.read() if hasattr(file, "read") else open(file, "rb").read()
+        mime_type = getattr(config, "mime_type", None) or "application/octet-stream"
+
+        with self._lock:
+            self.upload_count += 1
+            name = f"files/fake-{next(self._ids)}"
+            record = SimpleNamespace(
+                name=name,
+                uri=f"https://generativelanguage.local/v1beta/{name}",
+                mime_type=mime_type,
+                size_bytes=len(data),
+                expiration_time=datetime.now(timezone.utc) + self.ttl,
+            )
+            self.files[name] = (record, data)
+        return record
+
+    def get(self, name):
+        """Return the record for ``name``."""
+        return self.files[name][0]
+
+    def download(self, file):
+        """Return the content of the file ``file``."""
+        return self.files[file][1]
+
+    def delete(self, name):
+        """Remove the file ``name``."""
+        self.files.pop(name, None)
+
+
+def echo_first_image(request):
+    """Fake generation that returns the first input image unchanged.
+
+    Takes a batch request in its JSON form and returns a JSON
+    ``GenerateContentResponse`` with the REST field names.
+    """
+    blob = {"mime_type": "image/png", "data": ""}
+    for content in request["contents"]:
+        for part in content["parts"]:
+            if "inline_data" in part:
+                blob = part["inline_data"]
+                break
+        else:
+            continue
+        break
+    part = {"inlineData": {"mimeType": blob["mime_type"], "data": blob["data"]}}
+    return {"candidates": [{"content": {"role": "model", "parts": [part]}}]}
+
+
+class FakeGeminiBatchClient:
+    """In-memory stand-in for the parts of ``genai.Client`` the Batch API uses.
+
+    Provides ``files`` (a ``FakeFilesAPI``) and ``batches.create``/``get``.
+    Jobs read their requests from an uploaded JSONL file, finish after
+    ``polls_to_complete`` status checks and write their responses to an
+    output file. Individual requests fail with probability ``failure_rate``
+    so retry handling can be exercised.
+
+    Args:
+        generate: Callable turning a JSON request into a JSON response.
+        polls_to_complete: Number of ``get`` calls before a job succeeds.
+        failure_rate: Probability that a single request fails.
+        seed: Seed for the failure sampling.
+    """
+
+    def __init__(
+        self,
+        generate=echo_first_image,
+        polls_to_complete: int = 2,
+        failure_rate: float = 0.0,
+        seed: int = 0,
+    ):
+        self.generate = generate
+        self.polls_to_complete = polls_to_complete
+        self.failure_rate = failure_rate
+        self.jobs = {}
+        self.submitted_requests = 0
+        self.files = FakeFilesAPI()
+        self.batches = SimpleNamespace(create=self._create, get=self._get)
+        self._random = random.Random(seed)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _create(self, model, src, config=None):
+        if not isinstance(src, str):
+            raise ValueError("Batch jobs are read from an uploaded JSONL file.")
+        lines = self.files.download(src).decode("utf-8").splitlines()
+        requests = [json.loads(line) for line in lines if line.strip()]
+        with self._lock:
+            name = f"batches/fake-{next(self._ids)}"
+            self.submitted_requests += len(requests)
+            self.jobs[name] = {"model": model, "requests": requests, "polls": 0}
+        return self._job(name)
+
+    def _get(self, name):
+        with self._lock:
+            job = self.jobs[name]
+            job["polls"] += 1
+            if job["polls"] >= self.polls_to_complete and "output" not in job:
+                self._run(job)
+        return self._job(name)
+
+    def _run(self, job):
+        # Called with the lock held
+        lines = []
+        for request in job["requests"]:
+            record = {"key": request["key"]}
+            if self._random.random() < self.failure_rate:
+                record["error"] = {"code": 500, "message": "Simulated failure"}
+            else:
+                record["response"] = self.generate(request["request"])
+            lines.append(json.dumps(record))
+        output = self.files.upload(
+            BytesIO("\n".join(lines).encode("utf-8")),
+            SimpleNamespace(mime_type="jsonl"),
+        )
+        job["output"] = output.name
+
+    def _job(self, name):
+        job = self.jobs[name]
+        if "output" in job:
+            state = "JOB_STATE_SUCCEEDED"
+            dest = SimpleNamespace(file_name=job["output"])
+        else:
+            state = "JOB_STATE_RUNNING"
+            dest = None
+        return SimpleNamespace(name=name, state=SimpleNamespace(name=state), dest=dest)
+
+
+def echo_first_openai_image(body):
+    """Fake ``/v1/images/edits`` that returns the first input image unchanged."""
+    data_url = body["images"][0]["image_url"]
+    return {"data": [{"b64_json": data_url.split(",", 1)[1]}]}
+
+
+class FakeOpenAIBatchClient:
+    """In-memory stand-in for the parts of ``OpenAI`` the Batch API uses.
+
+    Provides ``files.create``/``files.content`` and
+    ``batches.create``/``batches.retrieve``. Batches complete after
+    ``polls_to_complete`` retrievals and write an output file and, if any
+    request failed, an error file in the Batch API's JSONL format.
+
+    Args:
+        generate: Callable turning a request body into a response body.
+        polls_to_complete: Number of ``retrieve`` calls before a batch completes.
+        failure_rate: Probability that a single request fails.
+        drop_rate: Probability that a request is missing from both files.
+        seed: Seed for the failure sampling.
+    """
+
+    def __init__(
+        self,
+        generate=echo_first_openai_image,
+        polls_to_complete: int = 2,
+        failure_rate: float = 0.0,
+        drop_rate: float = 0.0,
+        seed: int = 0,
+    ):
+        self.generate = generate
+        self.polls_to_complete = polls_to_complete
+        self.failure_rate = failure_rate
+        self.drop_rate = drop_rate
+        self.submitted_requests = 0
+        self.stored_files = {}
+        self.jobs = {}
+        self._random = random.Random(seed)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.files = SimpleNamespace(create=self._create_file, content=self._content)
+        self.batches = SimpleNamespace(create=self._create_batch, retrieve=self._get)
+
+    def _store(self, data: bytes) -> str:
+        file_id = f"file-fake-{next(self._ids)}"
+        self.stored_files[file_id] = data
+        return file_id
+
+    def _create_file(self, file, purpose):
+        name, data = file[0], file[1]
+        with self._lock:
+            return SimpleNamespace(id=self._store(data), filename=name, purpose=purpose)
+
+    def _content(self, file_id):
+        return SimpleNamespace(text=self.stored_files[file_id].decode("utf-8"))
+
+    def _create_batch(self, input_file_id, endpoint, completion_window):
+        lines = self.stored_files[input_file_id].decode("utf-8").splitlines()
+        requests = [json.loads(line) for line in lines if line.strip()]
+        for request in requests:
+            if request["method"] != "POST" or request["url"] != endpoint:
+                raise ValueError(f"Request {request['custom_id']} targets {endpoint}")
+        with self._lock:
+            batch_id = f"batch_fake-{next(self._ids)}"
+            self.submitted_requests += len(requests)
+            self.jobs[batch_id] = {"requests": requests, "polls": 0}
+        return self._get(batch_id, poll=False)
+
+    def _get(self, batch_id, poll=True):
+        with self._lock:
+            job = self.jobs[batch_id]
+            if poll:
+                job["polls"] += 1
+            if job["polls"] >= self.polls_to_complete and "output" not in job:
+                self._run(job)
+            done = "output" in job
+            return SimpleNamespace(
+                id=batch_id,
+                status="completed" if done else "in_progress",
+                output_file_id=job.get("output"),
+                error_file_id=job.get("errors"),
+            )
+
+    def _run(self, job):
+        # Called with the lock held
+        output, errors = [], []
+        for request in job["requests"]:
+            if self._random.random() < self.drop_rate:
+                continue
+            record = {"id": f"req-{next(self._ids)}", "custom_id": request["custom_id"]}
+            if self._random.random() < self.failure_rate:
+                record["response"] = {
+                    "status_code": 500,
+                    "body": {"error": {"message": "Simulated failure"}},
+                }
+                record["error"] = None
+                errors.append(json.dumps(record))
+            else:
+                record["response"] = {
+                    "status_code": 200,
+                    "body": self.generate(request["body"]),
+                }
+                record["error"] = None
+                output.append(json.dumps(record))
+        job["output"] = self._store("\n".join(output).encode("utf-8"))
+        if errors:
+            job["errors"] = self._store("\n".join(errors).encode("utf-8"))
+
+
+class FakeProviderServer:
+    """Local HTTP stand-in for the Gemini and OpenAI image endpoints.
+
+    Serves ``generateContent`` (Gemini) and ``/v1/images/edits`` (OpenAI) with
+    a fixed noise image after a log-normally distributed delay, and the
+    resumable Gemini Files API upload used for reference images. Point the
+    clients at it with ``GOOGLE_GEMINI_BASE_URL`` and ``OPENAI_BASE_URL``.
+
+    Args:
+        latency: Per-endpoint ``(median_seconds, sigma)`` of the delay, keyed
+            by ``"gemini"``, ``"openai"`` or ``"files"``.
+        image_size: Size of the returned image.
+        seed: Seed for the latency sampling.
+    """
+
+    def __init__(
+        self,
+        latency=None,
+        image_size=(1024, 1024),
+        host="127.0.0.1",
+        port=0,
+        seed=0,
+    ):
+        self.latency = {
+            "gemini": (6.0, 0.4),
+            "openai": (20.0, 0.35),
+            "files": (0.5, 0.3),
+        }
+        self.latency.update(latency or {})
+        self.request_count = 0
+        self.upload_count = 0
+        self._upload_ids = itertools.count(1)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+        buffer = BytesIO()
+        noise = PIL.Image.frombytes(
+            "RGB", image_size, os.urandom(image_size[0] * image_size[1] * 3)
+        )
+        noise.save(buffer, format="PNG", compress_level=1)
+        self._image_b64 = base64.b64encode(buffer.getvalue()).decode("ascii")
+
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, daemon=True, name="fake-provider"
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _delay(self, provider) -> float:
+        median, sigma = self.latency[provider]
+        with self._lock:
+            self.request_count += 1
+            return self._random.lognormvariate(math.log(median), sigma)
+
+    def _file_resource(self, path: str, data: bytes) -> Dict:
+        """Metadata of a finished upload, shaped like the Files API's."""
+        upload_id = path.rsplit("=", 1)[-1]
+        with self._lock:
+            self.upload_count += 1
+        expires = datetime.now(timezone.utc) + timedelta(hours=48)
+        return {
+            "name": f"files/{upload_id}",
+            "uri": f"{self.url}/v1beta/files/{upload_id}",
+            "mimeType": guess_mime_type(data),
+            "sizeBytes": str(len(data)),
+            "state": "ACTIVE",
+            "expirationTime": expires.isoformat().replace("+00:00", "Z"),
+        }
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                # Drain the upload like a real endpoint would
+                data = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+                headers = {}
+                command = self.headers.get("X-Goog-Upload-Command", "")
+                if self.path.startswith("/upload/") and command == "start":
+                    upload_id = next(server._upload_ids)
+                    headers["x-goog-upload-url"] = (
+                        f"{server.url}/upload/v1beta/files?upload_id={upload_id}"
+                    )
+                    body = {}
+                elif self.path.startswith("/upload/") and "upload" in command:
+                    if "finalize" not in command:
+                        headers["x-goog-upload-status"] = "active"
+                        body = {}
+                    else:
+                        time.sleep(server._delay("files"))
+                        body = {"file": server._file_resource(self.path, data)}
+                        headers["x-goog-upload-status"] = "final"
+                elif ":generateContent" in self.path:
+                    time.sleep(server._delay("gemini"))
+                    part = {
+                        "inlineData": {
+                            "mimeType": "image/png",
+                            "data": server._image_b64,
+                        }
+                    }
+                    body = {
+                        "candidates": [{"content": {"role": "model", "parts": [part]}}]
+                    }
+                elif self.path.rstrip("/").endswith("/images/edits"):
+                    time.sleep(server._delay("openai"))
+                    body = {
+                        "created": int(time.time()),
+                        "data": [{"b64_json": server._image_b64}],
+                    }
+                else:
+                    self.send_error(404)
+                    return
+
+                payload = json.dumps(body).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
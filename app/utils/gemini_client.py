@@ -1,88 +1,184 @@
 import os
 import pathlib
 from typing import Union, List
-import requests
 from io import BytesIO
 
 from google import genai
-from google.genai import types
+from google.genai import errors, types
 import PIL.Image
 from dotenv import load_dotenv
 import streamlit as st
 
+from app.utils.asset_manager import AssetManager, guess_mime_type
+from app.utils.deadline import (
+    Cancelled,
+    Deadline,
+    call_with_deadline,
+    map_with_deadline,
+)
+from app.utils.url_fetch import fetch_url, is_url, resolve_urls
+
 # Load environment variables
 load_dotenv()
 
+# Errors returned when a referenced file is gone or no longer accessible
+MISSING_FILE_CODES = (403, 404)
+
 
 # Get API key (prioritize Streamlit secrets over .env)
 def get_api_key():
     """Get API key from Streamlit secrets or environment variables."""
-    if hasattr(st, "secrets") and "GOOGLE_API_KEY" in st.secrets:
-        return st.secrets["GOOGLE_API_KEY"]
+    try:
+        if hasattr(st, "secrets") and "GOOGLE_API_KEY" in st.secrets:
+            return st.secrets["GOOGLE_API_KEY"]
+    except FileNotFoundError:
+        # No secrets file, e.g. when running as a headless worker
+        pass
     return os.getenv("GOOGLE_API_KEY")
 
 
-def process_image(image: Union[str, PIL.Image.Image, bytes]):
+@st.cache_resource
+def get_files_client():
+    """Client whose ``files`` namespace the asset manager uploads through.
+
+    Cached rather than created inline: the client closes its HTTP connection
+    once garbage collected, which would break every later upload.
+    """
+    return genai.Client(api_key=get_api_key())
+
+
+@st.cache_resource
+def get_asset_manager():
+    """Shared manager for reference images uploaded via the Files API."""
+    return AssetManager(get_files_client().files)
+
+
+def process_image(image: Union[str, PIL.Image.Image, bytes], deadline=None):
     """Process different image input types for Gemini API.
 
     Args:
         image: Can be a path string, PIL Image object, or bytes.
+        deadline: Optional ``Deadline`` bounding the URL fetch.
 
     Returns:
         Processed image ready for Gemini API.
     """
     if isinstance(image, str):
         # Check if it's a URL
-        if image.startswith(("http://", "https://")):
-            response = requests.get(image)
-            return response.content
+        if is_url(image):
+            data = call_with_deadline("fetch", deadline, fetch_url, image)
+            return types.Part.from_bytes(data=data, mime_type=guess_mime_type(data))
         # Assume it's a file path
-        return types.Part.from_bytes(
-            data=pathlib.Path(image).read_bytes(), mime_type="image/jpeg"
-        )
+        data = pathlib.Path(image).read_bytes()
+        return types.Part.from_bytes(data=data, mime_type=guess_mime_type(data))
     elif isinstance(image, PIL.Image.Image):
-        return image
+        # Encode here rather than in the SDK so it can run off the script
+        # thread; the fastest PNG setting keeps large photos cheap
+        buffer = BytesIO()
+        image.save(buffer, format="PNG", compress_level=1)
+        return types.Part.from_bytes(data=buffer.getvalue(), mime_type="image/png")
     elif isinstance(image, bytes):
-        return types.Part.from_bytes(data=image, mime_type="image/jpeg")
+        return types.Part.from_bytes(data=image, mime_type=guess_mime_type(image))
     else:
         raise TypeError(
             "Unsupported image type. Must be path string, PIL Image, or bytes."
         )
 
 
+def generate_content(model, contents, deadline: Deadline = None):
+    """Call ``generate_content`` within the deadline's generation budget."""
+
+    def generate(timeout):
+        client = genai.Client(
+            api_key=get_api_key(),
+            http_options=types.HttpOptions(timeout=int(timeout * 1000)),
+        )
+        return client.models.generate_content(
+            model=model,
+            contents=contents,
+            config=types.GenerateContentConfig(response_modalities=["Text", "Image"]),
+        )
+
+    return call_with_deadline("generate", deadline, generate)
+
+
 def image_to_image_generation(
-    source_image, prompt, model="gemini-2.0-flash-preview-image-generation"
+    source_image,
+    prompt,
+    model="gemini-2.0-flash-preview-image-generation",
+    deadline: Deadline = None,
 ):
     """Generate a transformed image based on a source image and prompt."""
+    deadline = deadline or Deadline()
+    processed_image = process_image(source_image, deadline=deadline)
 
-    processed_image = process_image(source_image)
-    api_key = get_api_key()
+    return generate_content(model, [prompt, processed_image], deadline=deadline)
 
-    client = genai.Client(api_key=api_key)
-    response = client.models.generate_content(
-        model=model,
-        contents=[prompt, processed_image],
-        config=types.GenerateContentConfig(response_modalities=["Text", "Image"]),
-    )
 
-    return response
+def process_reference_image(image: Union[str, PIL.Image.Image, bytes], deadline=None):
+    """Process a reference image, uploading it once via the Files API.
+
+    Reference images (clothing, backgrounds) are usually the same file across
+    many calls, so they are sent as a file URI instead of inline bytes. Falls
+    back to ``process_image`` for PIL images, URLs, or if the upload fails.
+    """
+    if isinstance(image, str) and not is_url(image):
+        image = pathlib.Path(image).read_bytes()
+    if not isinstance(image, bytes):
+        return process_image(image, deadline=deadline)
+
+    try:
+        return call_with_deadline(
+            "upload", deadline, get_asset_manager().get_part, image
+        )
+    except Cancelled:
+        raise
+    except Exception:
+        return process_image(image, deadline=deadline)
 
 
 def multi_image_generation(
-    images_list: List, prompt, model="gemini-2.0-flash-preview-image-generation"
+    images_list: List,
+    prompt,
+    model="gemini-2.0-flash-preview-image-generation",
+    upload_references=True,
+    deadline: Deadline = None,
 ):
-    """Generate content based on multiple images and a prompt."""
-    processed_images = [process_image(img) for img in images_list]
-    api_key = get_api_key()
-
-    client = genai.Client(api_key=api_key)
-    response = client.models.generate_content(
-        model=model,
-        contents=[prompt, *processed_images],
-        config=types.GenerateContentConfig(response_modalities=["Text", "Image"]),
-    )
+    """Generate content based on multiple images and a prompt.
+
+    The first image is the one being edited and is always sent inline. When
+    ``upload_references`` is set, the remaining images are uploaded once
+    through the Files API and referenced by URI on later calls.
+    """
+    deadline = deadline or Deadline()
+    # Download remote inputs concurrently before anything is uploaded
+    images_list = resolve_urls(images_list, deadline)
+    # Encode and upload all inputs at the same time
+    process_reference = process_reference_image if upload_references else process_image
+    processors = [process_image] + [process_reference] * (len(images_list) - 1)
+    processed_images = map_with_deadline("prepare", deadline, processors, images_list)
 
-    return response
+    try:
+        return generate_content(model, [prompt, *processed_images], deadline=deadline)
+    except errors.ClientError as e:
+        uploaded = any(part.file_data for part in processed_images[1:])
+        if not uploaded or e.code not in MISSING_FILE_CODES:
+            raise
+
+    # The Files API dropped an upload before its recorded expiry: forget the
+    # uploads so the next request makes new ones, and send inline this time
+    asset_manager = get_asset_manager()
+    references = [
+        pathlib.Path(image).read_bytes() if isinstance(image, str) else image
+        for image in images_list[1:]
+    ]
+    for reference in references:
+        if isinstance(reference, bytes):
+            asset_manager.invalidate(reference)
+    inline = [process_image(reference, deadline) for reference in references]
+    return generate_content(
+        model, [prompt, processed_images[0], *inline], deadline=deadline
+    )
 
 
 def extract_response_image(response):
@@ -117,6 +213,19 @@ def extract_response_image(response):
     return None
 
 
+def extract_response_bytes(response):
+    """Extract the encoded image bytes from a Gemini response without decoding."""
+    if response is None or not getattr(response, "candidates", None):
+        return None
+
+    for candidate in response.candidates:
+        if getattr(candidate, "content", None) and candidate.content.parts:
+            for part in candidate.content.parts:
+                if getattr(part, "inline_data", None) and part.inline_data.data:
+                    return part.inline_data.data
+    return None
+
+
 def extract_response_text(response):
     """Extract text from Gemini response."""
     for candidate in response.candidates:
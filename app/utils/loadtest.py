@@ -0,0 +1,401 @@
+"""Replay captured traffic against local stand-in providers.
+
+Record request shapes by running the app with ``TRAFFIC_CAPTURE_PATH`` set,
+then replay them at a chosen concurrency. Each simulated session drives the
+real app through Streamlit's ``AppTest``: it uploads images through the
+file uploaders, picks the recorded options and presses the tab's button, so
+every request goes through script reruns, the uploaded-file manager and the
+app's own caches and stores. The report shows what one replica can sustain.
+
+Usage:
+    TRAFFIC_CAPTURE_PATH=traffic.jsonl streamlit run app.py
+    python -m app.utils.loadtest traffic.jsonl --sessions 50 --requests 500
+"""
+
+import argparse
+import itertools
+import json
+import os
+import pathlib
+import random
+import resource
+import statistics
+import threading
+import time
+from io import BytesIO
+from typing import Dict, List
+
+import PIL.Image
+from streamlit.testing.v1 import AppTest, app_test
+from streamlit.testing.v1.local_script_runner import LocalScriptRunner
+
+from app.utils.deadline import get_pool_stats
+from app.utils.fake_providers import FakeProviderServer
+
+APP_PATH = pathlib.Path(__file__).resolve().parents[2] / "app.py"
+
+# How often memory and thread counts are sampled, in seconds
+SAMPLE_INTERVAL = 0.5
+
+# Longest a single script run may take, in seconds
+RUN_TIMEOUT = 600.0
+
+# How each tab is driven: its position, uploaders (filled in order with the
+# recorded images), provider selectbox, option widget and button. Widgets
+# without a key are found by label within the tab.
+_TABS = {
+    "tryon": {
+        "index": 0,
+        "uploads": ["tryon_person", "tryon_clothing"],
+        "provider": {"label": "Select AI provider"},
+        "option": {"label": "Clothing type"},
+        "button": {"label": "Generate Try-On Image"},
+    },
+    "style": {
+        "index": 1,
+        "uploads": ["primary_image_style", "secondary_image_style"],
+        "provider": {"key": "style_provider"},
+        "option": {"label": "Select transformation type"},
+        "button": {"key": "style_button"},
+    },
+    "product": {
+        "index": 2,
+        "uploads": ["product_image", "background_image"],
+        "provider": {"key": "product_provider"},
+        "option": {"key": "product_editing_type"},
+        "button": {"label": "Process Product Image"},
+    },
+    "pipeline": {
+        "index": 3,
+        "uploads": ["pipeline_image"],
+        "provider": {"key": "pipeline_provider"},
+        "button": {"key": "pipeline_button"},
+    },
+}
+
+
+def load_capture(path: str) -> List[Dict]:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def rss_bytes() -> int:
+    """Current resident set size of this process."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # Peak RSS is the best we can do without procfs (kB on Linux, B on macOS)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class _SyntheticImages:
+    """Random JPEGs with the recorded dimensions, generated once per size.
+
+    Every returned image ends in its own random trailer, which decoders
+    ignore, so caches keyed by content see distinct uploads as they would
+    with real users.
+    """
+
+    def __init__(self, seed=0):
+        self._cache = {}
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+
+    def get(self, shape: Dict) -> bytes:
+        size = (shape.get("width") or 1024, shape.get("height") or 1024)
+        with self._lock:
+            if size not in self._cache:
+                noise = PIL.Image.frombytes(
+                    "RGB", size, self._random.randbytes(size[0] * size[1] * 3)
+                )
+                buffer = BytesIO()
+                noise.save(buffer, format="JPEG", quality=90)
+                self._cache[size] = buffer.getvalue()
+            return self._cache[size] + self._random.randbytes(16)
+
+
+class _SessionScriptRunner(LocalScriptRunner):
+    """Script runner that gives each simulated session its own id.
+
+    ``AppTest`` runs every script under one fixed session id, which would
+    make all simulated sessions share their entries in the session memory
+    store. The id is passed in through the ``AppTest`` kwargs.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._session_id = self.kwargs.get("session_id", self._session_id)
+
+
+def _widget(tab, kind: str, key: str = None, label: str = None):
+    """The first ``kind`` widget in ``tab`` with the given key or label."""
+    for widget in getattr(tab, kind):
+        if (key and widget.key == key) or (label and widget.label == label):
+            return widget
+    return None
+
+
+def _upload(at: AppTest, spec: Dict, images: List[bytes], uploaded: set) -> bool:
+    """Fill the tab's uploaders that are shown and still empty."""
+    tab = at.tabs[spec["index"]]
+    changed = False
+    for key, data in zip(spec["uploads"], images):
+        uploader = _widget(tab, "file_uploader", key=key)
+        if uploader is None or key in uploaded:
+            continue
+        uploader.set_value((f"{key}.jpg", data, "image/jpeg"))
+        uploaded.add(key)
+        changed = True
+    return changed
+
+
+def _set_options(at: AppTest, spec: Dict, record: Dict):
+    tab = at.tabs[spec["index"]]
+    provider = _widget(tab, "selectbox", **spec["provider"])
+    if provider is not None and record.get("provider") in provider.options:
+        provider.set_value(record["provider"])
+
+    preset = record.get("preset") or ""
+    if record.get("tab") == "pipeline":
+        # Edits form a chain; "Effect: " steps are variants of its last step
+        names = preset.split(" > ")
+        steps = [name for name in names if not name.startswith("Effect: ")]
+        effects = [name[len("Effect: ") :] for name in names if name not in steps]
+        for key, values in (("pipeline_steps", steps), ("pipeline_effects", effects)):
+            widget = _widget(tab, "multiselect", key=key)
+            if widget is not None:
+                widget.set_value([v for v in values if v in widget.options])
+        return
+
+    option = _widget(tab, "selectbox", **spec["option"])
+    if option is not None and preset in option.options:
+        option.set_value(preset)
+
+
+def _problem(at: AppTest, spec: Dict):
+    """The error a request ended with, or None if it produced its images."""
+    if at.exception:
+        return "Exception"
+    tab = at.tabs[spec["index"]]
+    for error in tab.error:
+        # "Error processing image: <details>" is reported as its first part
+        return error.value.split(":")[0]
+    for warning in tab.warning:
+        if "no image was generated" in warning.value:
+            return "NoImage"
+    return None
+
+
+def _replay_one(at: AppTest, record: Dict, images: List[bytes]):
+    """Make the request in ``record`` the way a user would.
+
+    Uploads, option changes and the button press each cause a rerun, as in
+    the browser; only the run started by the button is timed.
+
+    Returns:
+        The seconds the request took and the error it ended with, if any.
+    """
+    spec = _TABS[record["tab"]]
+    uploaded = set()
+    _upload(at, spec, images, uploaded)
+    at.run(timeout=RUN_TIMEOUT)
+    _set_options(at, spec, record)
+    at.run(timeout=RUN_TIMEOUT)
+    # Some uploaders, like the product background, appear with an option
+    if _upload(at, spec, images, uploaded):
+        at.run(timeout=RUN_TIMEOUT)
+
+    button = _widget(at.tabs[spec["index"]], "button", **spec["button"])
+    if button is None:
+        return 0.0, "NoButton"
+    button.click()
+    started = time.monotonic()
+    at.run(timeout=RUN_TIMEOUT)
+    return time.monotonic() - started, _problem(at, spec)
+
+
+def replay(
+    records: List[Dict],
+    sessions: int = 10,
+    requests: int = 100,
+    session_requests: int = 5,
+    session_budget: int = None,
+) -> Dict:
+    """Replay captured requests from ``sessions`` concurrent simulated sessions.
+
+    Args:
+        records: Captured request shapes.
+        sessions: Concurrent simulated sessions.
+        requests: Total requests to send.
+        session_requests: Requests a session makes before it ends and frees
+            its state, after which a new session takes its place.
+        session_budget: Image bytes a session may keep in RAM before they
+            spill to disk; the app's default if unset.
+
+    Returns:
+        Throughput, latency percentiles, errors, RSS and thread counts.
+    """
+    from app.utils.session_memory import get_session_memory
+
+    records = [record for record in records if record.get("tab") in _TABS]
+    if not records:
+        raise ValueError("No captured requests to replay.")
+
+    synthetic = _SyntheticImages()
+    memory = get_session_memory()
+    if session_budget is not None:
+        memory.session_budget = session_budget
+    session_ids = itertools.count()
+    queue = itertools.islice(itertools.cycle(records), requests)
+    queue_lock = threading.Lock()
+    latencies, errors = [], []
+    results_lock = threading.Lock()
+    samples = {"rss": [], "threads": [], "spilled": []}
+    stop_sampling = threading.Event()
+
+    def sample():
+        while not stop_sampling.wait(SAMPLE_INTERVAL):
+            samples["rss"].append(rss_bytes())
+            samples["threads"].append(threading.active_count())
+            samples["spilled"].append(memory.stats()["spilled_bytes"])
+
+    def session_worker():
+        while True:
+            with queue_lock:
+                session = f"loadtest-{next(session_ids)}"
+            at = AppTest(
+                APP_PATH, default_timeout=RUN_TIMEOUT, kwargs={"session_id": session}
+            )
+            try:
+                at.run()
+                for turn in range(session_requests):
+                    with queue_lock:
+                        record = next(queue, None)
+                    if record is None:
+                        return
+                    images = [
+                        synthetic.get(shape) for shape in record.get("images", [])
+                    ]
+                    try:
+                        seconds, problem = _replay_one(at, record, images)
+                    except Exception as e:
+                        seconds, problem = None, type(e).__name__
+                    with results_lock:
+                        if problem:
+                            errors.append(problem)
+                        else:
+                            latencies.append(seconds)
+            finally:
+                # A closed browser tab: Streamlit frees the rest with the session
+                memory.drop(session)
+
+    rss_start = rss_bytes()
+    threads_start = threading.active_count()
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+
+    app_test.LocalScriptRunner = _SessionScriptRunner
+    started = time.monotonic()
+    try:
+        workers = [
+            threading.Thread(target=session_worker, name=f"session-{i}")
+            for i in range(sessions)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+    finally:
+        app_test.LocalScriptRunner = LocalScriptRunner
+    elapsed = time.monotonic() - started
+
+    stop_sampling.set()
+    sampler.join()
+
+    ordered = sorted(latencies)
+
+    def percentile(p):
+        if not ordered:
+            return None
+        return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))], 3)
+
+    return {
+        "sessions": sessions,
+        "requests": len(latencies) + len(errors),
+        "errors": len(errors),
+        "error_types": sorted(set(errors)),
+        "seconds": round(elapsed, 2),
+        "throughput_rps": round(len(latencies) / elapsed, 3) if elapsed else None,
+        "latency_p50": percentile(0.50),
+        "latency_p99": percentile(0.99),
+        "latency_mean": round(statistics.mean(ordered), 3) if ordered else None,
+        "rss_start_mb": round(rss_start / 2**20, 1),
+        "rss_peak_mb": round(max(samples["rss"], default=rss_start) / 2**20, 1),
+        "rss_end_mb": round(rss_bytes() / 2**20, 1),
+        "threads_start": threads_start,
+        "threads_peak": max(samples["threads"], default=threads_start),
+        "provider_workers": get_pool_stats()["workers"],
+        "spilled_peak_mb": round(max(samples["spilled"], default=0) / 2**20, 1),
+        "spill_count": memory.spill_count,
+    }
+
+
+def _latency_arg(value: str):
+    median, sigma = value.split(",")
+    return float(median), float(sigma)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("capture", help="JSONL file written via TRAFFIC_CAPTURE_PATH")
+    parser.add_argument("--sessions", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--session-requests", type=int, default=5)
+    parser.add_argument(
+        "--gemini-latency",
+        type=_latency_arg,
+        default=(6.0, 0.4),
+        help="median seconds and log-normal sigma, e.g. 6,0.4",
+    )
+    parser.add_argument("--openai-latency", type=_latency_arg, default=(20.0, 0.35))
+    parser.add_argument("--output-size", type=int, default=1024)
+    parser.add_argument(
+        "--session-budget-mb",
+        type=int,
+        default=None,
+        help="RAM budget per simulated session before images spill to disk",
+    )
+    args = parser.parse_args(argv)
+
+    server = FakeProviderServer(
+        latency={"gemini": args.gemini_latency, "openai": args.openai_latency},
+        image_size=(args.output_size, args.output_size),
+    ).start()
+    # Route both SDKs to the stand-in server
+    os.environ["GOOGLE_GEMINI_BASE_URL"] = server.url
+    os.environ["OPENAI_BASE_URL"] = f"{server.url}/v1"
+    os.environ.setdefault("GOOGLE_API_KEY", "load-test")
+    os.environ.setdefault("OPENAI_API_KEY", "load-test")
+
+    try:
+        report = replay(
+            load_capture(args.capture),
+            sessions=args.sessions,
+            requests=args.requests,
+            session_requests=args.session_requests,
+            session_budget=(
+                args.session_budget_mb * 2**20
+                if args.session_budget_mb is not None
+                else None
+            ),
+        )
+    finally:
+        server.stop()
+    report["provider_requests"] = server.request_count
+    report["files_uploaded"] = server.upload_count
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
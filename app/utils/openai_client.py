@@ -4,11 +4,20 @@ from io import BytesIO
 from typing import List, Union
 
 import PIL.Image
-import requests
 from dotenv import load_dotenv
 from openai import OpenAI
 import streamlit as st
 
+from app.utils.asset_manager import guess_mime_type
+from app.utils.deadline import (
+    Cancelled,
+    Deadline,
+    DeadlineExceeded,
+    call_with_deadline,
+    map_with_deadline,
+)
+from app.utils.url_fetch import fetch_url, is_url, resolve_urls
+
 # Load environment variables
 load_dotenv()
 
@@ -16,31 +25,36 @@ load_dotenv()
 # Get API key (prioritize Streamlit secrets over .env)
 def get_api_key():
     """Get API key from Streamlit secrets or environment variables."""
-    if hasattr(st, "secrets") and "OPENAI_API_KEY" in st.secrets:
-        return st.secrets["OPENAI_API_KEY"]
+    try:
+        if hasattr(st, "secrets") and "OPENAI_API_KEY" in st.secrets:
+            return st.secrets["OPENAI_API_KEY"]
+    except FileNotFoundError:
+        # No secrets file, e.g. when running as a headless worker
+        pass
     return os.getenv("OPENAI_API_KEY")
 
 
-def process_image(image: Union[str, PIL.Image.Image, bytes]):
+def process_image(image: Union[str, PIL.Image.Image, bytes], deadline=None):
     """Process different image input types for OpenAI API.
 
     Args:
         image: Can be a path string, PIL Image object, or bytes.
+        deadline: Optional ``Deadline`` bounding the URL fetch.
 
     Returns:
         Processed image in bytes format for OpenAI API.
     """
     if isinstance(image, str):
         # Check if it's a URL
-        if image.startswith(("http://", "https://")):
-            response = requests.get(image)
-            return response.content
+        if is_url(image):
+            return call_with_deadline("fetch", deadline, fetch_url, image)
         # Assume it's a file path
         with open(image, "rb") as f:
             return f.read()
     elif isinstance(image, PIL.Image.Image):
         buffer = BytesIO()
-        image.save(buffer, format="PNG")
+        # The API re-encodes uploads, so spend as little time compressing as possible
+        image.save(buffer, format="PNG", compress_level=1)
         return buffer.getvalue()
     elif isinstance(image, bytes):
         return image
@@ -50,60 +64,81 @@ def process_image(image: Union[str, PIL.Image.Image, bytes]):
         )
 
 
-def image_to_image_generation(image, prompt, model="gpt-image-1", size="1024x1024"):
+def upload_file(data: bytes, index: int = 0):
+    """Wrap encoded image bytes as a multipart file without copying them."""
+    mime_type = guess_mime_type(data)
+    return (f"image_{index}.{mime_type.split('/')[1]}", data, mime_type)
+
+
+def image_to_image_generation(
+    image, prompt, model="gpt-image-1", size="1024x1024", deadline: Deadline = None
+):
     """Generate a transformed image based on a source image and prompt."""
     api_key = get_api_key()
     client = OpenAI(api_key=api_key)
+    deadline = deadline or Deadline()
 
     # Process the image
-    processed_image = process_image(image)
-
-    # Convert bytes to file-like object with proper MIME type
-    import io
-
-    img_obj = io.BytesIO(processed_image)
-    img_obj.name = "image.png"  # Set a filename with extension
+    processed_image = process_image(image, deadline=deadline)
 
     try:
         # Use edit endpoint for a single image transformation
-        result = client.images.edit(
-            model=model, image=img_obj, prompt=prompt, size=size
+        result = call_with_deadline(
+            "generate",
+            deadline,
+            client.images.edit,
+            model=model,
+            image=upload_file(processed_image),
+            prompt=prompt,
+            size=size,
         )
         return result
+    except (Cancelled, DeadlineExceeded):
+        raise
     except Exception as e:
         st.error(f"Error with OpenAI image edit: {str(e)}")
         return None
 
 
 def multi_image_generation(
-    images_list: List, prompt, model="gpt-image-1", size="1024x1024"
+    images_list: List,
+    prompt,
+    model="gpt-image-1",
+    size="1024x1024",
+    deadline: Deadline = None,
 ):
     """Generate content based on multiple images and a prompt using OpenAI."""
     api_key = get_api_key()
     client = OpenAI(api_key=api_key)
+    deadline = deadline or Deadline()
 
-    processed_images = [process_image(img) for img in images_list]
+    # Download remote inputs concurrently, then encode any PIL images in
+    # parallel; bytes pass through untouched
+    images_list = resolve_urls(images_list, deadline)
+    processed_images = map_with_deadline(
+        "prepare", deadline, process_image, images_list
+    )
 
     # If there are multiple images, use the edit endpoint
     if len(processed_images) > 1:
         try:
-            # Convert bytes to file-like objects with proper MIME type
-            import io
-
-            # Prepare image objects as a list
-            image_objects = []
-            for i, img_bytes in enumerate(processed_images):
-                img_obj = io.BytesIO(img_bytes)
-                img_obj.name = f"image_{i}.png"  # Set filename with extension
-                image_objects.append(img_obj)
+            image_objects = [
+                upload_file(img_bytes, i)
+                for i, img_bytes in enumerate(processed_images)
+            ]
 
             # Call the edit endpoint with multiple images
-            result = client.images.edit(
+            result = call_with_deadline(
+                "generate",
+                deadline,
+                client.images.edit,
                 model=model,
-                image=image_objects,  # Pass list of file-like objects
+                image=image_objects,
                 prompt=prompt,
                 size=size,
             )
+        except (Cancelled, DeadlineExceeded):
+            raise
         except Exception as e:
             st.error(f"Error with OpenAI image edit: {str(e)}")
             return None
@@ -112,8 +147,10 @@ def multi_image_generation(
         # instead of generate to respect the input image
         try:
             return image_to_image_generation(
-                processed_images[0], prompt, model=model, size=size
+                processed_images[0], prompt, model=model, size=size, deadline=deadline
             )
+        except (Cancelled, DeadlineExceeded):
+            raise
         except Exception as e:
             st.error(f"Error with OpenAI image processing: {str(e)}")
             return None
@@ -121,8 +158,11 @@ def multi_image_generation(
     return result
 
 
-def extract_response_image(response):
-    """Extract image from OpenAI response."""
+def extract_response_image(response, deadline: Deadline = None):
+    """Extract image from OpenAI response.
+
+    ``deadline`` bounds the download when the response carries a URL.
+    """
     # Guard against None response
     if response is None:
         return None
@@ -136,14 +176,36 @@ def extract_response_image(response):
             return PIL.Image.open(BytesIO(image_bytes))
         elif has_data and hasattr(response.data[0], "url"):
             # If URL is provided instead of base64 content
-            response = requests.get(response.data[0].url)
-            return PIL.Image.open(BytesIO(response.content))
+            image_bytes = call_with_deadline(
+                "download", deadline, fetch_url, response.data[0].url, use_cache=False
+            )
+            return PIL.Image.open(BytesIO(image_bytes))
+    except (Cancelled, DeadlineExceeded):
+        raise
     except Exception as e:
         st.error(f"Error extracting image from OpenAI response: {str(e)}")
 
     return None
 
 
+def extract_response_bytes(response, deadline: Deadline = None):
+    """Extract the encoded image bytes from an OpenAI response without decoding.
+
+    ``deadline`` bounds the download when the response carries a URL.
+    """
+    if response is None or not getattr(response, "data", None):
+        return None
+
+    item = response.data[0]
+    if getattr(item, "b64_json", None):
+        return base64.b64decode(item.b64_json)
+    if getattr(item, "url", None):
+        return call_with_deadline(
+            "download", deadline, fetch_url, item.url, use_cache=False
+        )
+    return None
+
+
 def extract_response_text(response):
     """Extract text from OpenAI response if available."""
     # OpenAI image responses don't typically include text
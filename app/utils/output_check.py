@@ -0,0 +1,140 @@
+import math
+from io import BytesIO
+from typing import Callable, Optional, Tuple, Union
+
+import numpy as np
+import PIL.Image
+
+from app.utils.deadline import Cancelled, Deadline
+
+# Calls made for one request before a bad result is shown anyway
+DEFAULT_MAX_ATTEMPTS = 2
+
+# A retry is only started if at least this much of the deadline is left
+MIN_RETRY_SECONDS = 30.0
+
+# Side of the grayscale thumbnail the checks run on
+THUMBNAIL_SIZE = 64
+
+# Outputs with less contrast than this (0-255 standard deviation) are blank...
+UNIFORM_STD = 3.0
+
+# ...unless at least this many thumbnail pixels stand out from the background
+# (the median) by more than BACKGROUND_TOLERANCE, like a small product on white
+MIN_FOREGROUND_PIXELS = 4
+BACKGROUND_TOLERANCE = 16.0
+
+# Allowed relative difference between the output and the expected aspect ratio
+ASPECT_TOLERANCE = 0.1
+
+# Outputs closer than this to the source (mean 0-255 difference) are unchanged
+IDENTITY_DIFF = 2.0
+
+ImageInput = Union[PIL.Image.Image, bytes, None]
+
+
+def _open(image: ImageInput) -> Optional[PIL.Image.Image]:
+    if image is None or isinstance(image, PIL.Image.Image):
+        return image
+    return PIL.Image.open(BytesIO(image))
+
+
+def _thumbnail(image: PIL.Image.Image) -> np.ndarray:
+    small = image.convert("L").resize(
+        (THUMBNAIL_SIZE, THUMBNAIL_SIZE), PIL.Image.BILINEAR
+    )
+    return np.asarray(small, dtype=np.float32)
+
+
+def parse_aspect(value: Optional[str]) -> Optional[float]:
+    """Width / height of "4:3"-style ratios and "1024x1536"-style sizes."""
+    if not value:
+        return None
+    for separator in (":", "x"):
+        if separator in value:
+            width, height = value.split(" ")[0].split(separator)
+            return float(width) / float(height)
+    return None
+
+
+def check_output(
+    image: ImageInput,
+    source: ImageInput = None,
+    aspect: Optional[float] = None,
+) -> Optional[str]:
+    """Find obvious problems with a generated image.
+
+    Args:
+        image: The generated image, decoded or encoded.
+        source: The image that was edited, to detect unchanged outputs.
+        aspect: Expected width / height of the output.
+
+    Returns:
+        A short description of the problem, or None if the output looks fine.
+    """
+    image = _open(image)
+    if image is None:
+        return "no image was returned"
+
+    pixels = _thumbnail(image)
+    foreground = np.abs(pixels - np.median(pixels)) > BACKGROUND_TOLERANCE
+    if pixels.std() < UNIFORM_STD and foreground.sum() < MIN_FOREGROUND_PIXELS:
+        return "the image is nearly blank"
+
+    if aspect:
+        width, height = image.size
+        if abs(math.log((width / height) / aspect)) > math.log1p(ASPECT_TOLERANCE):
+            return f"the image is {width}x{height}, not the requested proportions"
+
+    source = _open(source)
+    if source is not None:
+        if np.abs(pixels - _thumbnail(source)).mean() < IDENTITY_DIFF:
+            return "the image is unchanged from the input"
+
+    return None
+
+
+def generate_checked(
+    generate: Callable[[], Tuple[ImageInput, Optional[str]]],
+    check: Callable[[ImageInput], Optional[str]],
+    deadline: Deadline,
+    max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+    first: Optional[Tuple[ImageInput, Optional[str]]] = None,
+):
+    """Call ``generate`` again when ``check`` finds a problem with its output.
+
+    Retries stop after ``max_attempts`` calls or when too little of the
+    deadline is left for another call. An error or timeout on a retry ends
+    the retries without losing the earlier attempts; cancellation and errors
+    on the first attempt are raised.
+
+    Args:
+        generate: Returns the output image and any text from the model.
+        check: Returns a problem description for an output image, or None.
+        deadline: The request deadline shared by all attempts.
+        max_attempts: Maximum number of attempts, ``first`` included.
+        first: An ``(image, text)`` produced ahead of time, checked as the
+            first attempt instead of calling ``generate``.
+
+    Returns:
+        The best image so far, its text, and its problem (None if it passed).
+        A flagged image counts as better than no image at all.
+    """
+    best = None
+    for attempt in range(max_attempts):
+        try:
+            image, text = first if attempt == 0 and first else generate()
+        except Cancelled:
+            raise
+        except Exception:
+            if attempt == 0:
+                raise
+            break
+        problem = check(image)
+        if problem is None:
+            return image, text, None
+        if best is None or (best[0] is None and image is not None):
+            best = (image, text, problem)
+        if deadline.remaining() < MIN_RETRY_SECONDS:
+            break
+    return best
@@ -0,0 +1,201 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+from app.utils.deadline import CancelToken
+
+# How often the runner wakes up to call ``on_tick`` while steps are running
+POLL_INTERVAL = 0.25
+
+
+@dataclass(frozen=True)
+class PipelineStep:
+    """One edit in a pipeline.
+
+    Args:
+        name: Unique name of the step.
+        prompt: Prompt sent to the model.
+        parent: Name of the step whose output this step edits, or ``None`` to
+            edit the source image. Steps sharing a parent form independent
+            branches and run concurrently.
+    """
+
+    name: str
+    prompt: str
+    parent: Optional[str] = None
+
+
+@dataclass
+class StepResult:
+    """Output of a pipeline step."""
+
+    name: str
+    data: bytes
+    cached: bool
+    seconds: float = 0.0
+    # Why the output looks wrong, if it was flagged
+    problem: Optional[str] = None
+
+
+class StepCache:
+    """Thread-safe LRU cache of step outputs, bounded by total bytes.
+
+    Args:
+        max_bytes: Largest total size of cached outputs.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+            return data
+
+    def put(self, key: str, data: bytes):
+        with self._lock:
+            if key in self._entries:
+                self._size -= len(self._entries.pop(key))
+            self._entries[key] = data
+            self._size += len(data)
+            while self._size > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+
+def step_keys(source: bytes, steps: List[PipelineStep], context: str = "") -> Dict:
+    """Compute the cache key of every step from its upstream inputs.
+
+    A step's key covers the source image, every prompt on its path from the
+    source, and ``context`` (provider, model and size), so editing a step only
+    invalidates that step and the steps below it.
+    """
+    by_name = {step.name: step for step in steps}
+    source_key = hashlib.sha256(source).hexdigest()
+    keys = {}
+
+    def key_for(step: PipelineStep) -> str:
+        if step.name not in keys:
+            upstream = (
+                source_key if step.parent is None else key_for(by_name[step.parent])
+            )
+            payload = "\0".join([upstream, context, step.prompt])
+            keys[step.name] = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+        return keys[step.name]
+
+    for step in steps:
+        key_for(step)
+    return keys
+
+
+def run_pipeline(
+    source: bytes,
+    steps: List[PipelineStep],
+    generate: Callable[[bytes, str], Optional[bytes]],
+    cache: StepCache,
+    context: str = "",
+    max_workers: int = 4,
+    on_tick: Optional[Callable[[], None]] = None,
+    token: Optional[CancelToken] = None,
+) -> Dict[str, StepResult]:
+    """Run a pipeline of edits, reusing cached step outputs.
+
+    Images travel between steps as encoded bytes; they are never decoded.
+    A step starts as soon as its parent finishes, so independent branches run
+    concurrently.
+
+    Args:
+        source: Encoded source image.
+        steps: Steps of the pipeline. Parents must be defined in ``steps``.
+        generate: ``generate(image_bytes, prompt)`` returning the encoded
+            output image, or ``None`` if the model returned no image, and a
+            problem description if the output looks wrong. Flagged outputs
+            and everything below them are not cached, so the next run
+            generates them again.
+        cache: Cache of step outputs shared across runs.
+        context: Anything besides the prompts that affects outputs, such as
+            the provider and model.
+        max_workers: Maximum number of steps generating at once.
+        on_tick: Called periodically while waiting on running steps.
+        token: Cancelled if the run is interrupted, so that ``generate``
+            calls sharing it stop waiting on the provider.
+
+    Returns:
+        A ``StepResult`` for each step that produced an image.
+
+    Raises:
+        ValueError: If a step names an unknown parent or names repeat.
+    """
+    names = [step.name for step in steps]
+    if len(set(names)) != len(names):
+        raise ValueError("Pipeline step names must be unique.")
+    for step in steps:
+        if step.parent is not None and step.parent not in names:
+            raise ValueError(f"Step {step.name!r} has unknown parent {step.parent!r}.")
+
+    keys = step_keys(source, steps, context)
+    children: Dict[Optional[str], List[PipelineStep]] = {}
+    for step in steps:
+        children.setdefault(step.parent, []).append(step)
+
+    results: Dict[str, StepResult] = {}
+
+    def run_step(
+        step: PipelineStep, data: bytes, flagged: bool
+    ) -> Optional[StepResult]:
+        # Below a flagged step the cache keys no longer describe the input
+        if not flagged:
+            cached = cache.get(keys[step.name])
+            if cached is not None:
+                return StepResult(step.name, cached, cached=True)
+        started = time.monotonic()
+        output, problem = generate(data, step.prompt)
+        if output is None:
+            return None
+        if not flagged and problem is None:
+            cache.put(keys[step.name], output)
+        return StepResult(step.name, output, False, time.monotonic() - started, problem)
+
+    pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pipeline")
+    running = {
+        pool.submit(run_step, step, source, False): step
+        for step in children.get(None, [])
+    }
+    flagged = set()
+    try:
+        while running:
+            done, _ = wait(running, timeout=POLL_INTERVAL, return_when=FIRST_COMPLETED)
+            if not done and on_tick:
+                on_tick()
+            for future in done:
+                step = running.pop(future)
+                result = future.result()
+                if result is None:
+                    # Nothing to feed the steps below this one
+                    continue
+                results[step.name] = result
+                if result.problem or step.parent in flagged:
+                    flagged.add(step.name)
+                for child in children.get(step.name, []):
+                    future = pool.submit(
+                        run_step, child, result.data, step.name in flagged
+                    )
+                    running[future] = child
+    except BaseException:
+        if token:
+            token.cancel()
+        raise
+    finally:
+        # Don't block on abandoned steps; they stop once the token is cancelled
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    return results
@@ -0,0 +1,165 @@
+import math
+from io import BytesIO
+from typing import Tuple
+
+import numpy as np
+import PIL.Image
+
+Box = Tuple[int, int, int, int]
+
+# Extra context around the region so the model sees how it meets its surroundings
+DEFAULT_PADDING = 0.08
+
+# Width of the blend between edited and original pixels, as a share of the box
+DEFAULT_FEATHER = 0.06
+
+# Smallest region side, in pixels; narrower boxes are widened to this
+MIN_REGION_SIZE = 16
+
+# Longest side of the thumbnail the product is detected on, in pixels
+DETECT_SIZE = 512
+
+
+def detect_product_box(image: PIL.Image.Image, threshold: int = 30) -> Box:
+    """Estimate the bounding box of the product in a studio-style photo.
+
+    The background color is taken as the median of the border pixels, and
+    every pixel that differs from it by more than ``threshold`` in any channel
+    counts as product. Detection runs on a thumbnail of at most
+    ``DETECT_SIZE`` pixels and the box is scaled back to ``image``.
+
+    Returns:
+        ``(left, top, right, bottom)``, or the whole frame if nothing stands
+        out from the background.
+    """
+    scale = min(1.0, DETECT_SIZE / max(image.size))
+    thumb_size = (
+        max(1, round(image.width * scale)),
+        max(1, round(image.height * scale)),
+    )
+    if image.mode == "P":
+        image = image.convert("RGBA")
+    thumb = image.resize(thumb_size, PIL.Image.BILINEAR, reducing_gap=2.0)
+
+    pixels = np.asarray(thumb.convert("RGB"), dtype=np.int16)
+    border = np.concatenate(
+        [pixels[0], pixels[-1], pixels[:, 0], pixels[:, -1]], axis=0
+    )
+    background = np.median(border, axis=0)
+
+    mask = (np.abs(pixels - background) > threshold).any(axis=2)
+    rows = np.flatnonzero(mask.any(axis=1))
+    cols = np.flatnonzero(mask.any(axis=0))
+    if rows.size == 0 or cols.size == 0:
+        return 0, 0, image.width, image.height
+
+    scale_x = image.width / thumb.width
+    scale_y = image.height / thumb.height
+    return (
+        int(cols[0] * scale_x),
+        int(rows[0] * scale_y),
+        min(image.width, math.ceil((cols[-1] + 1) * scale_x)),
+        min(image.height, math.ceil((rows[-1] + 1) * scale_y)),
+    )
+
+
+def percent_box(size: Tuple[int, int], x_range, y_range) -> Box:
+    """Convert horizontal/vertical percentage ranges into a pixel box."""
+    width, height = size
+    return (
+        round(width * x_range[0] / 100),
+        round(height * y_range[0] / 100),
+        round(width * x_range[1] / 100),
+        round(height * y_range[1] / 100),
+    )
+
+
+def _widen(low: int, high: int, limit: int, min_size: int) -> Tuple[int, int]:
+    """Grow ``[low, high)`` around its center to ``min_size``, within ``limit``."""
+    size = min(min_size, limit)
+    if high - low >= size:
+        return low, high
+    low = max(0, min((low + high - size) // 2, limit - size))
+    return low, low + size
+
+
+def pad_box(box: Box, size: Tuple[int, int], padding: float = DEFAULT_PADDING) -> Box:
+    """Grow ``box`` by ``padding`` of its size on each side, within the frame.
+
+    Boxes narrower than ``MIN_REGION_SIZE`` (e.g. from collapsed sliders) are
+    widened around their center so the crop is never empty.
+    """
+    left, top, right, bottom = box
+    pad_x = round((right - left) * padding)
+    pad_y = round((bottom - top) * padding)
+    left, right = _widen(
+        max(0, left - pad_x), min(size[0], right + pad_x), size[0], MIN_REGION_SIZE
+    )
+    top, bottom = _widen(
+        max(0, top - pad_y), min(size[1], bottom + pad_y), size[1], MIN_REGION_SIZE
+    )
+    return left, top, right, bottom
+
+
+def _check_box(box: Box):
+    left, top, right, bottom = box
+    if right <= left or bottom <= top:
+        raise ValueError(f"Region {box} is empty; pass it through pad_box first.")
+
+
+def encode_region(image: PIL.Image.Image, box: Box) -> bytes:
+    """Crop ``box`` out of ``image`` and encode it as PNG for upload."""
+    _check_box(box)
+    buffer = BytesIO()
+    image.crop(box).save(buffer, format="PNG", compress_level=1)
+    return buffer.getvalue()
+
+
+def _feather_mask(width: int, height: int, feather: int) -> np.ndarray:
+    """Alpha mask that is 1 inside the box and ramps to 0 at its edges."""
+    if feather <= 0:
+        return np.ones((height, width), dtype=np.float32)
+    x = np.arange(width, dtype=np.float32)
+    y = np.arange(height, dtype=np.float32)
+    # Distance of each pixel to the nearest edge, in pixels
+    dist_x = np.minimum(x + 0.5, width - x - 0.5)
+    dist_y = np.minimum(y + 0.5, height - y - 0.5)
+    dist = np.minimum(dist_y[:, None], dist_x[None, :])
+    return np.clip(dist / feather, 0.0, 1.0)
+
+
+def blend_region(
+    original: PIL.Image.Image,
+    edited: PIL.Image.Image,
+    box: Box,
+    feather: float = DEFAULT_FEATHER,
+) -> PIL.Image.Image:
+    """Paste an edited crop back into the full-resolution original.
+
+    The edited crop is resized to the box and blended in with a feathered
+    edge so no seam shows. Pixels outside the box are left untouched.
+
+    Args:
+        original: The full-resolution source image.
+        edited: The model output for the crop.
+        box: The ``(left, top, right, bottom)`` box the crop was taken from.
+        feather: Width of the blend as a share of the shorter box side.
+
+    Returns:
+        A copy of ``original`` with the region replaced.
+    """
+    _check_box(box)
+    left, top, right, bottom = box
+    width, height = right - left, bottom - top
+    mode = "RGBA" if original.mode in ("RGBA", "LA", "P") else "RGB"
+
+    result = original.convert(mode)
+    patch = edited.convert(mode).resize((width, height), PIL.Image.LANCZOS)
+
+    region = np.asarray(result.crop(box), dtype=np.float32)
+    patch_pixels = np.asarray(patch, dtype=np.float32)
+    alpha = _feather_mask(width, height, round(min(width, height) * feather))
+    blended = region + (patch_pixels - region) * alpha[:, :, None]
+
+    result.paste(PIL.Image.fromarray(np.rint(blended).astype(np.uint8)), (left, top))
+    return result
@@ -0,0 +1,239 @@
+import hashlib
+import mmap
+import os
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, field
+from io import BytesIO
+from typing import Callable, Dict, List, Optional, Union
+
+import PIL.Image
+import streamlit as st
+
+# Image bytes a session may keep in RAM before its coldest images are spilled
+DEFAULT_SESSION_BUDGET = int(os.getenv("SESSION_MEMORY_BUDGET_MB", "128")) * 2**20
+
+# Image bytes all sessions together may keep in RAM
+DEFAULT_TOTAL_BUDGET = int(os.getenv("TOTAL_MEMORY_BUDGET_MB", "1024")) * 2**20
+
+# Sessions untouched for this long are dropped even if still connected
+DEFAULT_SESSION_TTL = 60 * 60
+
+# Where spilled images are written; files are unlinked as soon as they are mapped
+SPILL_DIR = os.getenv("SESSION_SPILL_DIR") or tempfile.gettempdir()
+
+# Minimum seconds between sweeps for expired sessions
+SWEEP_INTERVAL = 60
+
+
+@dataclass
+class _Entry:
+    size: int
+    data: Optional[bytes] = None
+    mapped: Optional[mmap.mmap] = None
+    last_used: float = field(default_factory=time.monotonic)
+
+    @property
+    def spilled(self) -> bool:
+        return self.mapped is not None
+
+    def read(self) -> bytes:
+        return self.data if self.data is not None else self.mapped[:]
+
+    def close(self):
+        if self.mapped is not None:
+            self.mapped.close()
+            self.mapped = None
+        self.data = None
+
+
+def _encode(value: Union[bytes, PIL.Image.Image]) -> bytes:
+    if isinstance(value, bytes):
+        return value
+    buffer = BytesIO()
+    # Fast PNG settings: these are working copies, not downloads
+    value.save(buffer, format="PNG", compress_level=1)
+    return buffer.getvalue()
+
+
+class SessionMemory:
+    """Image store with a per-session and a global RAM budget.
+
+    Images are kept as encoded bytes. When a session or the whole process
+    goes over budget, the least recently used images are moved to anonymous
+    memory-mapped temp files, so the OS can page them out. Sessions that
+    have disconnected or been idle longer than ``ttl`` are dropped.
+
+    Args:
+        session_budget: Resident bytes allowed per session.
+        total_budget: Resident bytes allowed across all sessions.
+        ttl: Idle seconds before a session's images are dropped.
+        spill_dir: Directory for spill files.
+        is_active: Returns False once a session id has disconnected.
+    """
+
+    def __init__(
+        self,
+        session_budget: int = DEFAULT_SESSION_BUDGET,
+        total_budget: int = DEFAULT_TOTAL_BUDGET,
+        ttl: float = DEFAULT_SESSION_TTL,
+        spill_dir: str = SPILL_DIR,
+        is_active: Optional[Callable[[str], bool]] = None,
+    ):
+        self.session_budget = session_budget
+        self.total_budget = total_budget
+        self.ttl = ttl
+        self.spill_dir = spill_dir
+        self.is_active = is_active
+        self._sessions: Dict[str, Dict[str, _Entry]] = {}
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+        self.spill_count = 0
+        self.evicted_sessions = 0
+
+    def put(self, session: str, name: str, value: Union[bytes, PIL.Image.Image]):
+        """Store an image for a session, replacing any image with that name."""
+        data = _encode(value)
+        with self._lock:
+            entries = self._sessions.setdefault(session, {})
+            if name in entries:
+                entries.pop(name).close()
+            entries[name] = _Entry(size=len(data), data=data)
+            self._enforce(session)
+        self.sweep()
+
+    def put_group(
+        self, session: str, prefix: str, values: List[Union[bytes, PIL.Image.Image]]
+    ):
+        """Replace all images named ``prefix*`` with ``values``.
+
+        For a variable number of images, such as a request's uploads: fewer
+        images than last time must not leave stale ones behind.
+        """
+        with self._lock:
+            entries = self._sessions.get(session, {})
+            for key in [key for key in entries if key.startswith(prefix)]:
+                entries.pop(key).close()
+        for index, value in enumerate(values):
+            self.put(session, f"{prefix}{index}", value)
+
+    def get_bytes(self, session: str, name: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._sessions.get(session, {}).get(name)
+            if entry is None:
+                return None
+            entry.last_used = time.monotonic()
+            return entry.read()
+
+    def get_image(self, session: str, name: str) -> Optional[PIL.Image.Image]:
+        data = self.get_bytes(session, name)
+        if data is None:
+            return None
+        image = PIL.Image.open(BytesIO(data))
+        image.load()
+        return image
+
+    def drop(self, session: str, name: Optional[str] = None):
+        """Release one image, or all images of a session."""
+        with self._lock:
+            entries = self._sessions.get(session, {})
+            names = [name] if name else list(entries)
+            for key in names:
+                if key in entries:
+                    entries.pop(key).close()
+            if not entries:
+                self._sessions.pop(session, None)
+
+    def sweep(self, force=False):
+        """Drop sessions that have disconnected or expired."""
+        now = time.monotonic()
+        if not force and now - self._last_sweep < SWEEP_INTERVAL:
+            return
+        self._last_sweep = now
+
+        with self._lock:
+            sessions = list(self._sessions.items())
+        for session, entries in sessions:
+            last_used = max((e.last_used for e in entries.values()), default=0)
+            expired = now - last_used > self.ttl
+            if expired or (self.is_active and not self.is_active(session)):
+                self.drop(session)
+                self.evicted_sessions += 1
+
+    def stats(self) -> Dict:
+        """Resident and spilled bytes, in total and per session."""
+        now = time.monotonic()
+        sessions = []
+        with self._lock:
+            for session, entries in self._sessions.items():
+                values = list(entries.values())
+                sessions.append(
+                    {
+                        "session": hashlib.sha256(session.encode()).hexdigest()[:12],
+                        "images": len(values),
+                        "resident_bytes": sum(e.size for e in values if not e.spilled),
+                        "spilled_bytes": sum(e.size for e in values if e.spilled),
+                        "idle_seconds": round(
+                            now - max((e.last_used for e in values), default=now)
+                        ),
+                    }
+                )
+        return {
+            "resident_bytes": sum(s["resident_bytes"] for s in sessions),
+            "spilled_bytes": sum(s["spilled_bytes"] for s in sessions),
+            "spill_count": self.spill_count,
+            "evicted_sessions": self.evicted_sessions,
+            "sessions": sessions,
+        }
+
+    def _resident(self, entries) -> int:
+        return sum(e.size for e in entries if not e.spilled)
+
+    def _enforce(self, session: str):
+        # Called with the lock held
+        entries = self._sessions[session].values()
+        while self._resident(entries) > self.session_budget:
+            if not self._spill_coldest(entries):
+                break
+
+        all_entries = [e for s in self._sessions.values() for e in s.values()]
+        while self._resident(all_entries) > self.total_budget:
+            if not self._spill_coldest(all_entries):
+                break
+
+    def _spill_coldest(self, entries) -> bool:
+        resident = [e for e in entries if not e.spilled and e.size]
+        if not resident:
+            return False
+        entry = min(resident, key=lambda e: e.last_used)
+        with tempfile.TemporaryFile(dir=self.spill_dir) as f:
+            f.write(entry.data)
+            f.flush()
+            # The mapping keeps the unlinked file alive until it is closed
+            entry.mapped = mmap.mmap(f.fileno(), entry.size, access=mmap.ACCESS_READ)
+        entry.data = None
+        self.spill_count += 1
+        return True
+
+
+def current_session_id() -> str:
+    """Id of the Streamlit session running the current script."""
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx else "none"
+
+
+def _is_active_session(session: str) -> bool:
+    from streamlit.runtime import Runtime
+
+    if not Runtime.exists():
+        return True
+    return Runtime.instance().is_active_session(session)
+
+
+@st.cache_resource
+def get_session_memory() -> SessionMemory:
+    """Image store shared by all sessions of this process."""
+    return SessionMemory(is_active=_is_active_session)
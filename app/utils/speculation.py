@@ -0,0 +1,135 @@
+import json
+import os
+import pathlib
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import date
+from typing import Callable, Hashable, List, Optional
+
+import streamlit as st
+
+from app.utils.deadline import CancelToken, Deadline, wait_with_deadline
+
+# Preset usage counts and speculative spend, shared by restarts of this replica
+USAGE_PATH = pathlib.Path(
+    os.getenv("PRESET_USAGE_PATH", os.path.join(".cache", "preset_usage.json"))
+)
+
+# Most that speculative calls may cost per day, in US dollars
+DAILY_BUDGET = float(os.getenv("SPECULATIVE_DAILY_BUDGET_USD", "5"))
+
+# Rough cost of one image edit per provider, in US dollars
+ESTIMATED_COST = {"Google Gemini": 0.04, "OpenAI": 0.17}
+
+# Speculative calls running at the same time across all sessions
+MAX_WORKERS = 4
+
+
+class Speculation:
+    """A generation started before the user asked for it."""
+
+    def __init__(
+        self,
+        key: Hashable,
+        future: Future,
+        token: CancelToken,
+        refund: Optional[Callable[[], None]] = None,
+    ):
+        self.key = key
+        self.future = future
+        self.token = token
+        self._refund = refund
+
+    def cancel(self):
+        self.token.cancel()
+        # A job cancelled before it started never called the provider
+        if self.future.cancel() and self._refund:
+            self._refund()
+
+    def result(self, deadline: Deadline = None):
+        """Wait for the result within the generation budget of ``deadline``."""
+        return wait_with_deadline("generate", deadline, self.future)
+
+
+class Speculator:
+    """Learns which presets are used most and runs them ahead of time.
+
+    Speculative calls cost the same as real ones, so each start is charged
+    against a daily budget up front and refunded if it is cancelled while
+    still queued. Cancelling a running job only stops the wait; a provider
+    call already in flight still completes and is still paid for.
+
+    Args:
+        path: JSON file holding usage counts and daily spend.
+        daily_budget: Dollars speculative calls may cost per day.
+    """
+
+    def __init__(self, path=USAGE_PATH, daily_budget=DAILY_BUDGET):
+        self.path = pathlib.Path(path)
+        self.daily_budget = daily_budget
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=MAX_WORKERS, thread_name_prefix="speculative"
+        )
+        try:
+            self._state = json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            self._state = {}
+        self._state.setdefault("counts", {})
+        self._state.setdefault("spend", {})
+
+    def record_use(self, preset: str):
+        with self._lock:
+            counts = self._state["counts"]
+            counts[preset] = counts.get(preset, 0) + 1
+            self._save()
+
+    def likely(self, presets: List[str]) -> str:
+        """The most used of ``presets``; the first one until there is data."""
+        counts = self._state["counts"]
+        return max(presets, key=lambda preset: counts.get(preset, 0))
+
+    def spent_today(self) -> float:
+        return self._state["spend"].get(date.today().isoformat(), 0.0)
+
+    def start(
+        self, key: Hashable, cost: float, job: Callable[[Deadline], object]
+    ) -> Optional[Speculation]:
+        """Run ``job`` in the background unless it would exceed today's budget.
+
+        ``job`` gets a deadline without ``on_tick``, since it runs outside the
+        Streamlit script thread, and must stop when its token is cancelled.
+        """
+        today = date.today().isoformat()
+        with self._lock:
+            spent = self._state["spend"].get(today, 0.0)
+            if spent + cost > self.daily_budget:
+                return None
+            # Older days are no longer needed
+            self._state["spend"] = {today: spent + cost}
+            self._save()
+
+        token = CancelToken()
+        future = self._executor.submit(job, Deadline(token=token))
+        return Speculation(key, future, token, lambda: self._refund(today, cost))
+
+    def _refund(self, day: str, cost: float):
+        with self._lock:
+            spend = self._state["spend"]
+            # Nothing to give back once the day's spend has been rolled over
+            if day in spend:
+                spend[day] = max(0.0, spend[day] - cost)
+                self._save()
+
+    def _save(self):
+        # Called with the lock held
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self._state))
+        os.replace(tmp, self.path)
+
+
+@st.cache_resource
+def get_speculator() -> Speculator:
+    """Usage counts and spend tracking shared by all sessions."""
+    return Speculator()
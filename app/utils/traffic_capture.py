@@ -0,0 +1,60 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from io import BytesIO
+from typing import List
+
+import PIL.Image
+
+# Set to a file path to record the shape of every request for load testing
+CAPTURE_PATH = os.getenv("TRAFFIC_CAPTURE_PATH")
+
+_lock = threading.Lock()
+
+
+def _session_hash() -> str:
+    """Anonymized identifier of the current Streamlit session."""
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+        ctx = get_script_run_ctx()
+        session_id = ctx.session_id if ctx else "none"
+    except ImportError:
+        session_id = "none"
+    return hashlib.sha256(session_id.encode("utf-8")).hexdigest()[:12]
+
+
+def _image_shape(data) -> dict:
+    shape = {"bytes": len(data) if isinstance(data, bytes) else None}
+    try:
+        image = (
+            data if isinstance(data, PIL.Image.Image) else PIL.Image.open(BytesIO(data))
+        )
+        shape["width"], shape["height"] = image.size
+    except Exception:
+        pass
+    return shape
+
+
+def record_request(tab: str, preset: str, provider: str, images: List):
+    """Append the shape of a request to ``TRAFFIC_CAPTURE_PATH``.
+
+    Only sizes and the chosen options are recorded: never image content,
+    prompts or free-text instructions.
+    """
+    if not CAPTURE_PATH:
+        return
+
+    record = {
+        "ts": time.time(),
+        "session": _session_hash(),
+        "tab": tab,
+        "preset": preset,
+        "provider": provider,
+        "images": [_image_shape(image) for image in images],
+    }
+    with _lock:
+        with open(CAPTURE_PATH, "a") as f:
+            f.write(json.dumps(record) + "\n")
@@ -0,0 +1,241 @@
+import hashlib
+import json
+import os
+import pathlib
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from typing import List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from app.utils.deadline import Deadline, call_with_deadline
+
+# Largest remote image we are willing to download
+MAX_IMAGE_BYTES = 25 * 1024 * 1024
+
+# On-disk HTTP cache for remote images
+CACHE_DIR = pathlib.Path(os.getenv("IMAGE_CACHE_DIR", ".cache/images"))
+MAX_CACHE_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", 2 * 1024**3))
+
+# Number of URLs fetched at once for a multi-image request
+PREFETCH_WORKERS = 8
+
+_CHUNK_SIZE = 64 * 1024
+
+
+class ImageTooLarge(ValueError):
+    """Raised when a remote image exceeds the download size limit."""
+
+
+def _create_session() -> requests.Session:
+    session = requests.Session()
+    retries = Retry(
+        total=2,
+        backoff_factor=0.3,
+        status_forcelist=[502, 503, 504],
+        allowed_methods=["GET"],
+    )
+    adapter = HTTPAdapter(pool_connections=16, pool_maxsize=32, max_retries=retries)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+# Shared across threads so connections to the same CDN are reused
+_session = _create_session()
+
+
+def _cache_paths(url: str):
+    digest = hashlib.sha256(url.encode("utf-8")).hexdigest()
+    return CACHE_DIR / f"{digest}.body", CACHE_DIR / f"{digest}.json"
+
+
+def _load_cached(url: str):
+    body_path, meta_path = _cache_paths(url)
+    try:
+        meta = json.loads(meta_path.read_text())
+        body = body_path.read_bytes()
+    except (OSError, ValueError):
+        return None, None
+    if meta.get("url") != url:
+        return None, None
+    return meta, body
+
+
+def _atomic_write(path: pathlib.Path, data: bytes):
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _expires_at(headers) -> float:
+    """Return the time until which a response may be served without revalidating."""
+    cache_control = headers.get("Cache-Control", "").lower()
+    directives = [d.strip() for d in cache_control.split(",") if d.strip()]
+    if "no-cache" in directives:
+        return 0.0
+    for directive in directives:
+        if directive.startswith("max-age="):
+            try:
+                return time.time() + int(directive.split("=", 1)[1])
+            except ValueError:
+                return 0.0
+    if headers.get("Expires"):
+        try:
+            return parsedate_to_datetime(headers["Expires"]).timestamp()
+        except (TypeError, ValueError):
+            return 0.0
+    # No freshness information: always revalidate
+    return 0.0
+
+
+def _store(url: str, headers, body: Optional[bytes], meta: Optional[dict] = None):
+    if "no-store" in headers.get("Cache-Control", "").lower():
+        return
+
+    meta = dict(meta or {})
+    meta.update(
+        {
+            "url": url,
+            "etag": headers.get("ETag", meta.get("etag")),
+            "last_modified": headers.get("Last-Modified", meta.get("last_modified")),
+            "expires_at": _expires_at(headers),
+        }
+    )
+    if not meta["etag"] and not meta["last_modified"]:
+        if meta["expires_at"] <= time.time():
+            # Nothing to revalidate with and already stale
+            return
+
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        body_path, meta_path = _cache_paths(url)
+        if body is not None:
+            _atomic_write(body_path, body)
+        _atomic_write(meta_path, json.dumps(meta).encode("utf-8"))
+    except OSError:
+        # The cache is an optimisation; never fail a fetch because of it
+        return
+    if body is not None:
+        _prune_cache()
+
+
+def _prune_cache():
+    """Remove the least recently written entries above ``MAX_CACHE_BYTES``."""
+    try:
+        entries = [entry for entry in os.scandir(CACHE_DIR) if entry.is_file()]
+    except OSError:
+        return
+    total = sum(entry.stat().st_size for entry in entries)
+    if total <= MAX_CACHE_BYTES:
+        return
+
+    bodies = sorted(
+        (entry for entry in entries if entry.name.endswith(".body")),
+        key=lambda entry: entry.stat().st_mtime,
+    )
+    for entry in bodies:
+        if total <= MAX_CACHE_BYTES:
+            break
+        total -= entry.stat().st_size
+        meta_path = pathlib.Path(entry.path).with_suffix(".json")
+        for path in (pathlib.Path(entry.path), meta_path):
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+
+def _read_body(response: requests.Response, max_bytes: int) -> bytes:
+    content_length = response.headers.get("Content-Length")
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+        raise ImageTooLarge(
+            f"Image at {response.url} is {content_length} bytes; "
+            f"the limit is {max_bytes}."
+        )
+
+    chunks = []
+    received = 0
+    for chunk in response.iter_content(chunk_size=_CHUNK_SIZE):
+        received += len(chunk)
+        if received > max_bytes:
+            raise ImageTooLarge(
+                f"Image at {response.url} exceeds the {max_bytes} byte limit."
+            )
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+def fetch_url(
+    url: str,
+    timeout: Optional[float] = None,
+    max_bytes: int = MAX_IMAGE_BYTES,
+    use_cache: bool = True,
+) -> bytes:
+    """Download a remote image through the shared connection pool.
+
+    Responses are streamed and rejected once they exceed ``max_bytes``. When
+    ``use_cache`` is set, bodies are kept on disk and served again while fresh
+    according to ``Cache-Control``/``Expires``; stale entries are revalidated
+    with ``If-None-Match``/``If-Modified-Since``.
+
+    Args:
+        url: HTTP(S) URL of the image.
+        timeout: Socket timeout in seconds.
+        max_bytes: Largest body accepted.
+        use_cache: Whether to read from and write to the disk cache.
+
+    Returns:
+        The response body.
+    """
+    meta, cached_body = _load_cached(url) if use_cache else (None, None)
+    if meta and time.time() < meta.get("expires_at", 0):
+        return cached_body
+
+    headers = {}
+    if meta:
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+    with _session.get(url, headers=headers, stream=True, timeout=timeout) as response:
+        if response.status_code == 304 and meta:
+            # Still valid: only refresh the freshness information
+            _store(url, response.headers, None, meta)
+            return cached_body
+        response.raise_for_status()
+        body = _read_body(response, max_bytes)
+        if use_cache:
+            _store(url, response.headers, body)
+        return body
+
+
+def _fetch_all(urls: List[str], timeout: Optional[float] = None) -> List[bytes]:
+    if len(urls) == 1:
+        return [fetch_url(urls[0], timeout=timeout)]
+    with ThreadPoolExecutor(max_workers=min(PREFETCH_WORKERS, len(urls))) as pool:
+        return list(pool.map(lambda url: fetch_url(url, timeout=timeout), urls))
+
+
+def is_url(image) -> bool:
+    return isinstance(image, str) and image.startswith(("http://", "https://"))
+
+
+def resolve_urls(images: List, deadline: Deadline = None) -> List:
+    """Fetch every URL in ``images`` concurrently.
+
+    Returns:
+        ``images`` with each URL replaced by its downloaded bytes.
+    """
+    urls = list(dict.fromkeys(image for image in images if is_url(image)))
+    if not urls:
+        return list(images)
+
+    bodies = dict(zip(urls, call_with_deadline("fetch", deadline, _fetch_all, urls)))
+    return [bodies[image] if is_url(image) else image for image in images]
@@ -0,0 +1,726 @@
+"""Lease-based bulk processing shared by several worker nodes.
+
+Nodes coordinate only through files in a queue directory on a shared
+filesystem (such as NFS) and write outputs to a shared directory. Work is
+split into shards; a node leases a shard, renews the lease with heartbeats
+while it works, and another node steals the shard if the lease expires.
+Results are committed idempotently, so a stolen shard never produces
+duplicates.
+
+Byte-range locks are unreliable on network filesystems, so nothing here
+locks. Files other nodes may race for are created exclusively: the record is
+written to a temporary file and hard-linked into place, which fails if the
+target already exists. Everything else is replaced by atomic renames.
+
+Layout of the queue directory::
+
+    shards/<id>.json            items of a shard, written once by ``enqueue``
+    shards/<id>.done            marker of a finished shard (or ``.failed``)
+    leases/<id>.<attempt>.json  owner and expiry of each lease of a shard
+    results/<digest>.json       one record per committed item
+    nodes/<node>.json           progress of a node, written only by that node
+
+A shard's current lease is its highest attempt. Stealing an expired lease
+means creating the next attempt, so exactly one node wins it.
+
+Usage:
+    python -m app.utils.work_queue enqueue --queue jobs/ manifest.jsonl
+    python -m app.utils.work_queue work --queue jobs/ --output out/
+    python -m app.utils.work_queue work --queue jobs/ --output out/ --batch
+    python -m app.utils.work_queue stats --queue jobs/
+
+Each manifest line is a JSON object with ``key``, ``images`` (paths, URLs)
+and ``prompt``.
+"""
+
+import argparse
+import collections
+import hashlib
+import json
+import os
+import pathlib
+import socket
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from io import BytesIO
+from typing import Callable, Dict, Iterable, List, Optional
+
+from app.utils.deadline import PROVIDER_CALL_WORKERS, set_provider_workers
+
+DEFAULT_LEASE_SECONDS = 120.0
+DEFAULT_SHARD_SIZE = 25
+DEFAULT_MAX_ATTEMPTS = 3
+
+
+def open_queue(path) -> pathlib.Path:
+    """Create the queue directory layout if needed and return its path."""
+    queue = pathlib.Path(path)
+    for name in ("shards", "leases", "results", "nodes"):
+        (queue / name).mkdir(parents=True, exist_ok=True)
+    return queue
+
+
+def _safe_name(name: str) -> str:
+    return "".join(c if c.isalnum() or c in "-_." else "_" for c in name)
+
+
+def _temp_file(directory: pathlib.Path, data: bytes) -> str:
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    return tmp_path
+
+
+def _create_exclusive(path: pathlib.Path, record: Dict) -> bool:
+    """Create ``path`` holding ``record`` unless it already exists.
+
+    Works like ``O_EXCL``, but other nodes never see the file half written.
+
+    Returns:
+        ``True`` if this call created the file.
+    """
+    tmp_path = _temp_file(path.parent, json.dumps(record).encode("utf-8"))
+    try:
+        os.link(tmp_path, path)
+        return True
+    except FileExistsError:
+        return False
+    finally:
+        os.unlink(tmp_path)
+
+
+def _replace(path: pathlib.Path, record: Dict):
+    os.replace(_temp_file(path.parent, json.dumps(record).encode("utf-8")), path)
+
+
+def _read(path: pathlib.Path) -> Optional[Dict]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _shard_path(queue: pathlib.Path, shard_id: int, suffix: str) -> pathlib.Path:
+    return queue / "shards" / f"{shard_id:06d}.{suffix}"
+
+
+def _lease_path(queue: pathlib.Path, shard_id: int, attempt: int) -> pathlib.Path:
+    return queue / "leases" / f"{shard_id:06d}.{attempt}.json"
+
+
+def _result_path(queue: pathlib.Path, key: str) -> pathlib.Path:
+    # Keys are hashed so that keys differing only in unsafe characters
+    # cannot collide
+    digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+    return queue / "results" / f"{digest}.json"
+
+
+def _shard_ids(queue: pathlib.Path) -> List[int]:
+    return sorted(int(path.stem) for path in (queue / "shards").glob("*.json"))
+
+
+def _shard_items(queue: pathlib.Path, shard_id: int) -> List[Dict]:
+    return _read(_shard_path(queue, shard_id, "json"))["items"]
+
+
+def _latest_attempts(queue: pathlib.Path) -> Dict[int, int]:
+    """The current (highest) lease attempt of every shard that has one."""
+    latest = {}
+    for path in (queue / "leases").glob("*.json"):
+        shard_id, attempt = (int(part) for part in path.stem.split("."))
+        latest[shard_id] = max(latest.get(shard_id, 0), attempt)
+    return latest
+
+
+def _latest_attempt(queue: pathlib.Path, shard_id: int) -> int:
+    attempts = [
+        int(path.stem.split(".")[1])
+        for path in (queue / "leases").glob(f"{shard_id:06d}.*.json")
+    ]
+    return max(attempts, default=0)
+
+
+def _finished(queue: pathlib.Path, shard_id: int) -> bool:
+    return (
+        _shard_path(queue, shard_id, "done").exists()
+        or _shard_path(queue, shard_id, "failed").exists()
+    )
+
+
+def enqueue(
+    queue: pathlib.Path, items: Iterable[Dict], shard_size=DEFAULT_SHARD_SIZE
+) -> int:
+    """Add items to the queue in shards of ``shard_size``.
+
+    Items whose key is already queued are skipped, so a manifest can be
+    enqueued again safely.
+
+    Returns:
+        The number of newly queued items.
+    """
+    shard_ids = _shard_ids(queue)
+    queued_keys = {
+        item["key"] for shard_id in shard_ids for item in _shard_items(queue, shard_id)
+    }
+    fresh = []
+    for item in items:
+        if item["key"] in queued_keys:
+            continue
+        queued_keys.add(item["key"])
+        fresh.append(
+            {"key": item["key"], "images": item["images"], "prompt": item["prompt"]}
+        )
+
+    shard_id = max(shard_ids, default=0) + 1
+    for start in range(0, len(fresh), shard_size):
+        record = {"items": fresh[start : start + shard_size]}
+        # Another node enqueueing at the same time may take an id first
+        while not _create_exclusive(_shard_path(queue, shard_id, "json"), record):
+            shard_id += 1
+        shard_id += 1
+    return len(fresh)
+
+
+def claim_shard(
+    queue: pathlib.Path,
+    node: str,
+    lease_seconds=DEFAULT_LEASE_SECONDS,
+    max_attempts=DEFAULT_MAX_ATTEMPTS,
+) -> Optional[int]:
+    """Lease the next pending shard, or steal one whose lease has expired.
+
+    An expired shard that has already been leased ``max_attempts`` times is
+    marked failed instead of stolen, so a shard that keeps killing its nodes
+    is not retried forever.
+
+    Returns:
+        The shard id, or ``None`` if there is nothing left to claim.
+    """
+    now = time.time()
+    latest = _latest_attempts(queue)
+    for shard_id in _shard_ids(queue):
+        if _finished(queue, shard_id):
+            continue
+        attempt = latest.get(shard_id, 0)
+        if attempt:
+            lease = _read(_lease_path(queue, shard_id, attempt))
+            if lease is None or lease["expires"] >= now:
+                continue
+            if attempt >= max_attempts:
+                _create_exclusive(
+                    _shard_path(queue, shard_id, "failed"), {"finished_at": now}
+                )
+                continue
+        lease = {"node": node, "expires": now + lease_seconds}
+        # Losing this race means another node claimed the shard first
+        if _create_exclusive(_lease_path(queue, shard_id, attempt + 1), lease):
+            return shard_id
+    return None
+
+
+def _own_lease(queue: pathlib.Path, shard_id: int, node: str):
+    """The path and record of the shard's current lease if ``node`` holds it."""
+    attempt = _latest_attempt(queue, shard_id)
+    path = _lease_path(queue, shard_id, attempt)
+    lease = _read(path) if attempt else None
+    if lease is None or lease["node"] != node:
+        return None, None
+    return path, lease
+
+
+def renew_lease(
+    queue: pathlib.Path,
+    shard_id: int,
+    node: str,
+    lease_seconds=DEFAULT_LEASE_SECONDS,
+) -> bool:
+    """Extend a lease. Returns ``False`` if the node no longer holds it."""
+    path, lease = _own_lease(queue, shard_id, node)
+    if lease is None:
+        return False
+    lease["expires"] = time.time() + lease_seconds
+    _replace(path, lease)
+    return True
+
+
+def release_shard(
+    queue: pathlib.Path,
+    shard_id: int,
+    node: str,
+    complete: bool,
+    max_attempts=DEFAULT_MAX_ATTEMPTS,
+):
+    """Give a shard back once the node is done with it.
+
+    Complete shards are marked done. Incomplete ones go back to pending so
+    another node retries the missing items, until ``max_attempts`` is used up.
+    """
+    path, lease = _own_lease(queue, shard_id, node)
+    if lease is None:
+        return
+    if complete or _latest_attempt(queue, shard_id) >= max_attempts:
+        state = "done" if complete else "failed"
+        _create_exclusive(
+            _shard_path(queue, shard_id, state), {"finished_at": time.time()}
+        )
+    else:
+        lease["expires"] = 0
+        _replace(path, lease)
+
+
+def pending_items(queue: pathlib.Path, shard_id: int) -> List[Dict]:
+    """Items of a shard that have no committed result yet."""
+    return sorted(
+        (
+            item
+            for item in _shard_items(queue, shard_id)
+            if not _result_path(queue, item["key"]).exists()
+        ),
+        key=lambda item: item["key"],
+    )
+
+
+def commit_result(queue: pathlib.Path, key: str, output_path: str, node: str) -> bool:
+    """Record a finished item. The first commit for a key wins.
+
+    Returns:
+        ``True`` if this call recorded the result.
+    """
+    record = {
+        "key": key,
+        "output_path": output_path,
+        "node": node,
+        "finished_at": time.time(),
+    }
+    return _create_exclusive(_result_path(queue, key), record)
+
+
+def record_progress(queue: pathlib.Path, node: str, started_at: float, totals: Dict):
+    """Publish a node's item counts. Each node only writes its own file."""
+    record = {
+        "node": node,
+        "started_at": started_at,
+        "last_seen": time.time(),
+        "items_done": totals.get("done", 0),
+        "items_failed": totals.get("failed", 0),
+        "items_lost": totals.get("lost", 0),
+    }
+    _replace(queue / "nodes" / f"{_safe_name(node)}.json", record)
+
+
+def queue_stats(queue: pathlib.Path) -> Dict:
+    """Shard counts by state and per-node throughput in items per minute."""
+    now = time.time()
+    latest = _latest_attempts(queue)
+    shards = collections.Counter()
+    total = 0
+    for shard_id in _shard_ids(queue):
+        total += len(_shard_items(queue, shard_id))
+        if _shard_path(queue, shard_id, "done").exists():
+            shards["done"] += 1
+        elif _shard_path(queue, shard_id, "failed").exists():
+            shards["failed"] += 1
+        else:
+            lease = latest.get(shard_id) and _read(
+                _lease_path(queue, shard_id, latest[shard_id])
+            )
+            shards["leased" if lease and lease["expires"] >= now else "pending"] += 1
+
+    nodes = []
+    for path in sorted((queue / "nodes").glob("*.json")):
+        row = _read(path)
+        elapsed = max(row["last_seen"] - row["started_at"], 1e-9)
+        nodes.append(
+            {
+                "node": row["node"],
+                "items_done": row["items_done"],
+                "items_failed": row["items_failed"],
+                "items_lost": row["items_lost"],
+                "items_per_minute": round(row["items_done"] * 60 / elapsed, 2),
+                "last_seen": row["last_seen"],
+            }
+        )
+    finished = sum(1 for _ in (queue / "results").glob("*.json"))
+    return {
+        "shards": dict(shards),
+        "items": total,
+        "finished": finished,
+        "nodes": nodes,
+    }
+
+
+def _write_output(output_dir: pathlib.Path, key: str, data: bytes) -> str:
+    """Write an output atomically; rewriting the same key is harmless."""
+    path = output_dir / f"{_safe_name(key)}.png"
+    os.replace(_temp_file(output_dir, data), path)
+    return str(path)
+
+
+class _Heartbeat(threading.Thread):
+    """Renews a shard lease until stopped or the lease is lost."""
+
+    def __init__(self, queue, shard_id, node, lease_seconds):
+        super().__init__(daemon=True, name=f"heartbeat-{shard_id}")
+        self.queue = queue
+        self.shard_id = shard_id
+        self.node = node
+        self.lease_seconds = lease_seconds
+        self.lost = threading.Event()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.lease_seconds / 3):
+            if not renew_lease(
+                self.queue, self.shard_id, self.node, self.lease_seconds
+            ):
+                self.lost.set()
+                return
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def run_worker(
+    queue_dir: str,
+    output_dir: str,
+    generate: Callable[[List, str], Optional[bytes]],
+    node: Optional[str] = None,
+    concurrency: int = 8,
+    lease_seconds: float = DEFAULT_LEASE_SECONDS,
+    max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+) -> Dict:
+    """Process shards until the queue is drained.
+
+    While other nodes still hold leases, the node keeps polling so it can
+    steal their shards if they stop heartbeating.
+
+    Args:
+        queue_dir: Path of the shared queue directory.
+        output_dir: Shared directory receiving ``<key>.png`` outputs.
+        generate: ``generate(images, prompt)`` returning encoded output bytes,
+            or ``None`` if no image was produced.
+        node: Name of this node; defaults to the host name plus a suffix.
+        concurrency: Provider calls kept in flight by this node.
+        lease_seconds: Lease length; heartbeats renew it every third of it.
+        max_attempts: Leases per shard before it is marked failed.
+
+    Returns:
+        Counts of items this node finished, failed, and skipped because
+        another node took over their shard.
+    """
+    node = node or f"{socket.gethostname()}-{uuid.uuid4().hex[:6]}"
+    output_path = pathlib.Path(output_dir)
+    output_path.mkdir(parents=True, exist_ok=True)
+
+    queue = open_queue(queue_dir)
+    started_at = time.time()
+    totals = {"done": 0, "failed": 0, "lost": 0}
+    record_progress(queue, node, started_at, totals)
+
+    def process(item, heartbeat):
+        if heartbeat.lost.is_set():
+            # Another node owns the shard now; let it finish the item
+            return "lost"
+        try:
+            data = generate(item["images"], item["prompt"])
+        except Exception:
+            data = None
+        if data is None:
+            return "failed"
+        path = _write_output(output_path, item["key"], data)
+        commit_result(queue, item["key"], path, node)
+        return "done"
+
+    # Items are submitted across shard boundaries so ``concurrency`` calls
+    # stay in flight; the next shard is claimed as soon as a slot frees up
+    backlog = collections.deque()
+    shards = {}
+    in_flight = {}
+
+    def finish(shard_id):
+        shard = shards.pop(shard_id)
+        shard["heartbeat"].stop()
+        release_shard(queue, shard_id, node, shard["complete"], max_attempts)
+
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            while True:
+                while len(in_flight) < concurrency:
+                    if not backlog:
+                        shard_id = claim_shard(queue, node, lease_seconds, max_attempts)
+                        if shard_id is None:
+                            break
+                        heartbeat = _Heartbeat(queue, shard_id, node, lease_seconds)
+                        heartbeat.start()
+                        items = pending_items(queue, shard_id)
+                        shards[shard_id] = {
+                            "heartbeat": heartbeat,
+                            "left": len(items),
+                            "complete": True,
+                        }
+                        if not items:
+                            finish(shard_id)
+                        backlog.extend((shard_id, item) for item in items)
+                        continue
+                    shard_id, item = backlog.popleft()
+                    future = pool.submit(process, item, shards[shard_id]["heartbeat"])
+                    in_flight[future] = shard_id
+
+                if not in_flight:
+                    # Shards still open here are leased by other nodes
+                    if all(_finished(queue, i) for i in _shard_ids(queue)):
+                        break
+                    time.sleep(min(lease_seconds / 3, 10))
+                    continue
+
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    shard_id = in_flight.pop(future)
+                    status = future.result()
+                    totals[status] += 1
+                    shard = shards[shard_id]
+                    shard["left"] -= 1
+                    shard["complete"] = shard["complete"] and status == "done"
+                    if shard["left"] == 0:
+                        finish(shard_id)
+                record_progress(queue, node, started_at, totals)
+    finally:
+        for shard in shards.values():
+            shard["heartbeat"].stop()
+
+    record_progress(queue, node, started_at, totals)
+    return {"node": node, **totals}
+
+
+def run_batch_worker(
+    queue_dir: str,
+    output_dir: str,
+    backend,
+    node: Optional[str] = None,
+    concurrency: int = 4,
+    lease_seconds: float = DEFAULT_LEASE_SECONDS,
+    max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+    poll_interval: float = 30.0,
+) -> Dict:
+    """Process shards through a provider batch API until the queue is drained.
+
+    Each leased shard is submitted as one batch job (see ``run_batch``), so
+    the shard size sets the batch size. Heartbeats keep the lease while the
+    job runs, however long the provider takes.
+
+    Args:
+        queue_dir: Path of the shared queue directory.
+        output_dir: Shared directory receiving ``<key>.png`` outputs.
+        backend: A ``GeminiBatchBackend`` or ``OpenAIBatchBackend``.
+        node: Name of this node; defaults to the host name plus a suffix.
+        concurrency: Batch jobs kept open by this node.
+        lease_seconds: Lease length; heartbeats renew it every third of it.
+        max_attempts: Leases per shard before it is marked failed.
+        poll_interval: Initial delay between job status checks, in seconds.
+
+    Returns:
+        Counts of items this node finished, failed, and skipped because
+        another node took over their shard.
+    """
+    from app.utils.batch import BatchRequest, run_batch
+
+    node = node or f"{socket.gethostname()}-{uuid.uuid4().hex[:6]}"
+    output_path = pathlib.Path(output_dir)
+    output_path.mkdir(parents=True, exist_ok=True)
+
+    queue = open_queue(queue_dir)
+    started_at = time.time()
+    totals = {"done": 0, "failed": 0, "lost": 0}
+    record_progress(queue, node, started_at, totals)
+
+    def process(shard_id, heartbeat):
+        items = pending_items(queue, shard_id)
+        counts = collections.Counter()
+        if heartbeat.lost.is_set():
+            counts["lost"] = len(items)
+            return counts
+        requests = [
+            BatchRequest(key=item["key"], images=item["images"], prompt=item["prompt"])
+            for item in items
+        ]
+        try:
+            for result in run_batch(
+                requests,
+                backend,
+                chunk_size=max(len(requests), 1),
+                poll_interval=poll_interval,
+            ):
+                if result.image is None:
+                    counts["failed"] += 1
+                    continue
+                buffer = BytesIO()
+                result.image.save(buffer, format="PNG")
+                path = _write_output(output_path, result.key, buffer.getvalue())
+                commit_result(queue, result.key, path, node)
+                counts["done"] += 1
+        except Exception:
+            # Items without a result are retried with the shard
+            counts["failed"] = len(items) - counts["done"]
+        return counts
+
+    running = {}
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            while True:
+                while len(running) < concurrency:
+                    shard_id = claim_shard(queue, node, lease_seconds, max_attempts)
+                    if shard_id is None:
+                        break
+                    heartbeat = _Heartbeat(queue, shard_id, node, lease_seconds)
+                    heartbeat.start()
+                    future = pool.submit(process, shard_id, heartbeat)
+                    running[future] = (shard_id, heartbeat)
+
+                if not running:
+                    # Shards still open here are leased by other nodes
+                    if all(_finished(queue, i) for i in _shard_ids(queue)):
+                        break
+                    time.sleep(min(lease_seconds / 3, 10))
+                    continue
+
+                # Wake up now and then to steal shards whose lease expired
+                finished, _ = wait(
+                    running,
+                    timeout=min(lease_seconds / 3, 10),
+                    return_when=FIRST_COMPLETED,
+                )
+                for future in finished:
+                    shard_id, heartbeat = running.pop(future)
+                    heartbeat.stop()
+                    counts = future.result()
+                    for status, count in counts.items():
+                        totals[status] += count
+                    complete = not counts["failed"] and not counts["lost"]
+                    release_shard(queue, shard_id, node, complete, max_attempts)
+                record_progress(queue, node, started_at, totals)
+    finally:
+        for _, heartbeat in running.values():
+            heartbeat.stop()
+
+    record_progress(queue, node, started_at, totals)
+    return {"node": node, **totals}
+
+
+def _provider_generate(provider: str, model: Optional[str], size: str):
+    """Build a ``generate`` callable for a provider's multi-image endpoint."""
+    if provider == "gemini":
+        from app.utils import gemini_client
+
+        model = model or "gemini-2.0-flash-preview-image-generation"
+
+        def generate(images, prompt):
+            response = gemini_client.multi_image_generation(images, prompt, model=model)
+            return gemini_client.extract_response_bytes(response)
+
+    else:
+        from app.utils import openai_client
+
+        model = model or "gpt-image-1"
+
+        def generate(images, prompt):
+            response = openai_client.multi_image_generation(
+                images, prompt, model=model, size=size
+            )
+            return openai_client.extract_response_bytes(response)
+
+    return generate
+
+
+def _provider_batch_backend(provider: str, model: Optional[str], size: str):
+    """Build a batch backend for a provider's Batch API."""
+    from app.utils.batch import GeminiBatchBackend, OpenAIBatchBackend
+
+    if provider == "gemini":
+        from google import genai
+
+        from app.utils import gemini_client
+
+        client = genai.Client(api_key=gemini_client.get_api_key())
+        model = model or "gemini-2.0-flash-preview-image-generation"
+        return GeminiBatchBackend(client, model=model)
+
+    from openai import OpenAI
+
+    from app.utils import openai_client
+
+    client = OpenAI(api_key=openai_client.get_api_key())
+    return OpenAIBatchBackend(client, model=model or "gpt-image-1", size=size)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    enqueue_parser = commands.add_parser("enqueue", help="queue a JSONL manifest")
+    enqueue_parser.add_argument("manifest")
+    enqueue_parser.add_argument("--queue", required=True)
+    enqueue_parser.add_argument("--shard-size", type=int, default=DEFAULT_SHARD_SIZE)
+
+    work_parser = commands.add_parser("work", help="process shards on this node")
+    work_parser.add_argument("--queue", required=True)
+    work_parser.add_argument("--output", required=True)
+    work_parser.add_argument(
+        "--provider", choices=["gemini", "openai"], default="gemini"
+    )
+    work_parser.add_argument("--model")
+    work_parser.add_argument("--size", default="1024x1024")
+    work_parser.add_argument("--node")
+    work_parser.add_argument("--concurrency", type=int, default=8)
+    work_parser.add_argument(
+        "--lease-seconds", type=float, default=DEFAULT_LEASE_SECONDS
+    )
+    work_parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="submit each shard as one provider batch job instead of live calls",
+    )
+
+    stats_parser = commands.add_parser("stats", help="show queue and node progress")
+    stats_parser.add_argument("--queue", required=True)
+
+    args = parser.parse_args(argv)
+    queue = open_queue(args.queue)
+
+    if args.command == "enqueue":
+        with open(args.manifest) as f:
+            items = [json.loads(line) for line in f if line.strip()]
+        print(f"Queued {enqueue(queue, items, args.shard_size)} items.")
+    elif args.command == "work" and args.batch:
+        summary = run_batch_worker(
+            args.queue,
+            args.output,
+            _provider_batch_backend(args.provider, args.model, args.size),
+            node=args.node,
+            concurrency=args.concurrency,
+            lease_seconds=args.lease_seconds,
+        )
+        print(json.dumps(summary))
+    elif args.command == "work":
+        if args.concurrency > PROVIDER_CALL_WORKERS:
+            # Provider calls share one pool, which would cap the concurrency
+            set_provider_workers(args.concurrency)
+        summary = run_worker(
+            args.queue,
+            args.output,
+            _provider_generate(args.provider, args.model, args.size),
+            node=args.node,
+            concurrency=args.concurrency,
+            lease_seconds=args.lease_seconds,
+        )
+        print(json.dumps(summary))
+    else:
+        print(json.dumps(queue_stats(queue), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+import threading
+import time
+from datetime import timedelta
+
+import pytest
+from google.genai import errors
+
+from app.utils import gemini_client
+from app.utils.asset_manager import EXPIRY_MARGIN, AssetManager
+from app.utils.fake_providers import FakeFilesAPI
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"reference" * 100
+
+
+def test_same_bytes_are_uploaded_once():
+    files = FakeFilesAPI()
+    manager = AssetManager(files)
+
+    first = manager.get_asset(PNG)
+    second = manager.get_asset(bytes(PNG))
+
+    assert files.upload_count == 1
+    assert first.uri == second.uri
+    assert first.mime_type == "image/png"
+
+
+def test_different_bytes_get_their_own_upload():
+    files = FakeFilesAPI()
+    manager = AssetManager(files)
+
+    manager.get_asset(PNG)
+    manager.get_asset(PNG + b"other")
+
+    assert files.upload_count == 2
+
+
+def test_expired_asset_is_uploaded_again():
+    # Files that expire within the safety margin count as expired already
+    files = FakeFilesAPI(ttl=EXPIRY_MARGIN - timedelta(minutes=1))
+    manager = AssetManager(files)
+
+    first = manager.get_asset(PNG)
+    second = manager.get_asset(PNG)
+
+    assert files.upload_count == 2
+    assert first.uri != second.uri
+
+
+def test_expired_assets_are_dropped():
+    files = FakeFilesAPI(ttl=EXPIRY_MARGIN - timedelta(minutes=1))
+    manager = AssetManager(files)
+
+    for i in range(5):
+        manager.get_asset(PNG + bytes([i]))
+
+    # Each upload clears out the entries that expired before it
+    assert len(manager._assets) == 1
+
+
+def test_invalidate_forces_a_new_upload():
+    files = FakeFilesAPI()
+    manager = AssetManager(files)
+
+    manager.get_asset(PNG)
+    manager.invalidate(PNG)
+    manager.get_asset(PNG)
+
+    assert files.upload_count == 2
+
+
+def test_concurrent_requests_for_one_digest_upload_once():
+    class SlowFilesAPI(FakeFilesAPI):
+        def upload(self, file, config=None):
+            time.sleep(0.05)
+            return super().upload(file, config)
+
+    files = SlowFilesAPI()
+    manager = AssetManager(files)
+    barrier = threading.Barrier(8)
+    uris = []
+
+    def fetch():
+        barrier.wait()
+        uris.append(manager.get_asset(PNG).uri)
+
+    threads = [threading.Thread(target=fetch) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert files.upload_count == 1
+    assert len(set(uris)) == 1
+
+
+def test_missing_file_is_invalidated_and_sent_inline(monkeypatch):
+    files = FakeFilesAPI()
+    manager = AssetManager(files)
+    monkeypatch.setattr(gemini_client, "get_asset_manager", lambda: manager)
+
+    calls = []
+
+    def generate_content(model, contents, deadline=None):
+        calls.append(contents)
+        if any(getattr(part, "file_data", None) for part in contents[1:]):
+            raise errors.ClientError(
+                404, {"error": {"code": 404, "message": "File not found"}}
+            )
+        return "ok"
+
+    monkeypatch.setattr(gemini_client, "generate_content", generate_content)
+
+    result = gemini_client.multi_image_generation([PNG, PNG + b"ref"], "prompt")
+
+    assert result == "ok"
+    assert len(calls) == 2
+    assert calls[1][2].inline_data.data == PNG + b"ref"
+    # The dropped upload was forgotten, so the next request uploads again
+    manager.get_asset(PNG + b"ref")
+    assert files.upload_count == 2
+
+
+def test_other_client_errors_are_not_retried(monkeypatch):
+    manager = AssetManager(FakeFilesAPI())
+    monkeypatch.setattr(gemini_client, "get_asset_manager", lambda: manager)
+
+    def generate_content(model, contents, deadline=None):
+        raise errors.ClientError(400, {"error": {"code": 400, "message": "Bad"}})
+
+    monkeypatch.setattr(gemini_client, "generate_content", generate_content)
+
+    with pytest.raises(errors.ClientError):
+        gemini_client.multi_image_generation([PNG, PNG + b"ref"], "prompt")
@@ -0,0 +1,139 @@
+import json
+from io import BytesIO
+
+import PIL.Image
+import pytest
+
+from app.utils.batch import (
+    BatchRequest,
+    GeminiBatchBackend,
+    OpenAIBatchBackend,
+    run_batch,
+)
+from app.utils.fake_providers import FakeGeminiBatchClient, FakeOpenAIBatchClient
+
+
+def _png(color):
+    buffer = BytesIO()
+    PIL.Image.new("RGB", (8, 8), color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _requests(count):
+    return [
+        BatchRequest(key=f"sku-{i}", images=[_png((i, 0, 0))], prompt="edit")
+        for i in range(count)
+    ]
+
+
+def _backends(**options):
+    return {
+        "gemini": lambda: GeminiBatchBackend(FakeGeminiBatchClient(**options)),
+        "openai": lambda: OpenAIBatchBackend(FakeOpenAIBatchClient(**options)),
+    }
+
+
+def _run(requests, backend, **kwargs):
+    kwargs.setdefault("poll_interval", 0)
+    return {result.key: result for result in run_batch(requests, backend, **kwargs)}
+
+
+@pytest.mark.parametrize("provider", ["gemini", "openai"])
+def test_every_request_gets_its_own_image(provider):
+    backend = _backends()[provider]()
+    results = _run(_requests(5), backend)
+
+    assert sorted(results) == [f"sku-{i}" for i in range(5)]
+    for i in range(5):
+        result = results[f"sku-{i}"]
+        assert result.error is None
+        assert result.attempts == 1
+        # The fakes echo the input, so the output identifies the request
+        assert result.image.convert("RGB").getpixel((0, 0)) == (i, 0, 0)
+
+
+@pytest.mark.parametrize("provider", ["gemini", "openai"])
+def test_failed_requests_are_requeued(provider):
+    backend = _backends(failure_rate=0.4, seed=1)[provider]()
+    results = _run(_requests(20), backend, max_attempts=10)
+
+    assert all(result.image is not None for result in results.values())
+    assert any(result.attempts > 1 for result in results.values())
+
+
+@pytest.mark.parametrize("provider", ["gemini", "openai"])
+def test_requests_fail_after_max_attempts(provider):
+    backend = _backends(failure_rate=1.0)[provider]()
+    results = _run(_requests(3), backend, max_attempts=2)
+
+    for result in results.values():
+        assert result.image is None
+        assert result.attempts == 2
+        assert "Simulated failure" in result.error
+
+
+def test_missing_results_are_requeued():
+    client = FakeOpenAIBatchClient(drop_rate=0.5, seed=2)
+    results = _run(_requests(10), OpenAIBatchBackend(client), max_attempts=10)
+
+    assert all(result.image is not None for result in results.values())
+    assert client.submitted_requests > 10
+
+
+def test_missing_results_fail_after_max_attempts():
+    client = FakeOpenAIBatchClient(drop_rate=1.0)
+    results = _run(_requests(2), OpenAIBatchBackend(client), max_attempts=2)
+
+    for result in results.values():
+        assert result.error == "Missing from batch results."
+        assert result.attempts == 2
+
+
+@pytest.mark.parametrize("provider", ["gemini", "openai"])
+def test_requests_are_split_into_chunks(provider):
+    backend = _backends()[provider]()
+    results = _run(_requests(10), backend, chunk_size=4)
+
+    assert len(results) == 10
+    assert len(backend.client.jobs) == 3
+
+
+def test_openai_requests_are_packed_as_image_edits():
+    client = FakeOpenAIBatchClient()
+    backend = OpenAIBatchBackend(client, model="gpt-image-1", size="1024x1536")
+    job_id = backend.submit(_requests(2))
+
+    requests = client.jobs[job_id]["requests"]
+    assert [request["custom_id"] for request in requests] == ["sku-0", "sku-1"]
+    assert requests[0]["url"] == "/v1/images/edits"
+    assert requests[0]["body"]["size"] == "1024x1536"
+    assert requests[0]["body"]["images"][0]["image_url"].startswith(
+        "data:image/png;base64,"
+    )
+
+
+def test_gemini_requests_are_uploaded_as_a_jsonl_file():
+    client = FakeGeminiBatchClient()
+    backend = GeminiBatchBackend(client)
+    job_id = backend.submit(_requests(2))
+
+    ((record, data),) = client.files.files.values()
+    assert record.mime_type == "jsonl"
+    lines = [json.loads(line) for line in data.decode("utf-8").splitlines()]
+    assert [line["key"] for line in lines] == ["sku-0", "sku-1"]
+    parts = lines[0]["request"]["contents"][0]["parts"]
+    assert parts[0] == {"text": "edit"}
+    assert parts[1]["inline_data"]["mime_type"] == "image/png"
+
+    while not backend.poll(job_id):
+        pass
+    assert [key for key, _, _ in backend.results(job_id)] == ["sku-0", "sku-1"]
+    # Only the job's output file is left once its results have been read
+    assert record.name not in client.files.files
+
+
+def test_duplicate_keys_are_rejected():
+    requests = _requests(2)
+    requests[1].key = requests[0].key
+    with pytest.raises(ValueError):
+        list(run_batch(requests, GeminiBatchBackend(FakeGeminiBatchClient())))
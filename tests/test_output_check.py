@@ -0,0 +1,36 @@
+import PIL.Image
+import PIL.ImageDraw
+
+from app.utils.output_check import check_output
+
+
+def _product(size, product_size, color=(40, 60, 90)):
+    image = PIL.Image.new("RGB", (size, size), "white")
+    start = (size - product_size) // 2
+    PIL.ImageDraw.Draw(image).rectangle(
+        (start, start, start + product_size, start + product_size), fill=color
+    )
+    return image
+
+
+def test_blank_image_is_flagged():
+    image = PIL.Image.new("RGB", (1000, 1000), "white")
+
+    assert check_output(image) == "the image is nearly blank"
+
+
+def test_small_product_on_white_is_not_blank():
+    assert check_output(_product(1000, 60)) is None
+    assert check_output(_product(1000, 60, color=(200, 200, 200))) is None
+
+
+def test_unchanged_output_is_flagged():
+    image = _product(512, 200)
+
+    assert check_output(image, image.copy()) == "the image is unchanged from the input"
+
+
+def test_wrong_proportions_are_flagged():
+    problem = check_output(_product(512, 200).resize((512, 256)), aspect=1.0)
+
+    assert problem == "the image is 512x256, not the requested proportions"
@@ -0,0 +1,188 @@
+import threading
+import time
+
+import PIL.Image
+
+from app.utils import work_queue
+from app.utils.batch import GeminiBatchBackend
+from app.utils.fake_providers import FakeGeminiBatchClient
+from app.utils.work_queue import (
+    claim_shard,
+    commit_result,
+    enqueue,
+    open_queue,
+    pending_items,
+    queue_stats,
+    release_shard,
+    renew_lease,
+    run_batch_worker,
+    run_worker,
+)
+
+
+def _items(count):
+    return [{"key": f"sku-{i}", "images": [], "prompt": "edit"} for i in range(count)]
+
+
+def _queue(tmp_path, count=4, shard_size=2):
+    queue = open_queue(tmp_path / "queue")
+    enqueue(queue, _items(count), shard_size=shard_size)
+    return queue
+
+
+def test_enqueue_skips_queued_keys(tmp_path):
+    queue = _queue(tmp_path)
+
+    assert enqueue(queue, _items(6), shard_size=2) == 2
+    assert queue_stats(queue)["items"] == 6
+
+
+def test_claim_leases_each_shard_once(tmp_path):
+    queue = _queue(tmp_path)
+
+    assert claim_shard(queue, "a") == 1
+    assert claim_shard(queue, "b") == 2
+    assert claim_shard(queue, "c") is None
+    assert queue_stats(queue)["shards"] == {"leased": 2}
+
+
+def test_expired_lease_is_stolen(tmp_path):
+    queue = _queue(tmp_path, count=2)
+
+    assert claim_shard(queue, "a", lease_seconds=-1) == 1
+    assert claim_shard(queue, "b") == 1
+    assert not renew_lease(queue, 1, "a")
+    assert renew_lease(queue, 1, "b")
+
+    # The old owner can no longer give the shard back
+    release_shard(queue, 1, "a", complete=True)
+    assert queue_stats(queue)["shards"] == {"leased": 1}
+
+
+def test_released_shard_is_retried_until_max_attempts(tmp_path):
+    queue = _queue(tmp_path, count=2)
+
+    for node in ("a", "b"):
+        assert claim_shard(queue, node, max_attempts=2) == 1
+        release_shard(queue, 1, node, complete=False, max_attempts=2)
+
+    assert claim_shard(queue, "c", max_attempts=2) is None
+    assert queue_stats(queue)["shards"] == {"failed": 1}
+
+
+def test_expired_shard_fails_after_max_attempts(tmp_path):
+    queue = _queue(tmp_path, count=2)
+
+    for node in ("a", "b"):
+        assert claim_shard(queue, node, lease_seconds=-1, max_attempts=2) == 1
+
+    assert claim_shard(queue, "c", max_attempts=2) is None
+    assert queue_stats(queue)["shards"] == {"failed": 1}
+
+
+def test_commit_result_is_idempotent(tmp_path):
+    queue = _queue(tmp_path, count=2)
+
+    assert commit_result(queue, "sku-0", "out/a.png", "a")
+    assert not commit_result(queue, "sku-0", "out/b.png", "b")
+    assert [item["key"] for item in pending_items(queue, 1)] == ["sku-1"]
+    assert queue_stats(queue)["finished"] == 1
+
+
+def test_two_nodes_process_every_item_once(tmp_path):
+    queue = _queue(tmp_path, count=40, shard_size=3)
+    calls = []
+    lock = threading.Lock()
+
+    def generate(images, prompt):
+        with lock:
+            calls.append(prompt)
+        return b"png"
+
+    summaries = []
+
+    def work(node):
+        summaries.append(
+            run_worker(
+                str(queue),
+                str(tmp_path / "out"),
+                generate,
+                node=node,
+                concurrency=4,
+                lease_seconds=3,
+            )
+        )
+
+    threads = [threading.Thread(target=work, args=(node,)) for node in ("a", "b")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    stats = queue_stats(queue)
+    assert stats["finished"] == 40
+    assert stats["shards"] == {"done": 14}
+    assert len(calls) == 40
+    assert sum(summary["done"] for summary in summaries) == 40
+    assert len(list((tmp_path / "out").glob("*.png"))) == 40
+
+
+def test_failed_items_are_counted(tmp_path):
+    queue = _queue(tmp_path, count=2)
+
+    summary = run_worker(
+        str(queue),
+        str(tmp_path / "out"),
+        lambda images, prompt: None,
+        node="a",
+        max_attempts=1,
+    )
+
+    assert summary == {"node": "a", "done": 0, "failed": 2, "lost": 0}
+    assert queue_stats(queue)["shards"] == {"failed": 1}
+
+
+def test_items_of_a_lost_lease_are_not_counted_as_failed(tmp_path, monkeypatch):
+    queue = _queue(tmp_path, count=2)
+    # Heartbeats report the lease as lost after a third of its length
+    monkeypatch.setattr(work_queue, "renew_lease", lambda *args: False)
+
+    def generate(images, prompt):
+        time.sleep(0.2)
+        return b"png"
+
+    summary = run_worker(
+        str(queue),
+        str(tmp_path / "out"),
+        generate,
+        node="a",
+        concurrency=1,
+        lease_seconds=0.3,
+        max_attempts=1,
+    )
+
+    assert summary == {"node": "a", "done": 1, "failed": 0, "lost": 1}
+
+
+def test_batch_worker_submits_each_shard_as_one_job(tmp_path):
+    image = tmp_path / "input.png"
+    PIL.Image.new("RGB", (8, 8), "red").save(image)
+    queue = open_queue(tmp_path / "queue")
+    items = [
+        {"key": f"sku-{i}", "images": [str(image)], "prompt": "edit"} for i in range(5)
+    ]
+    enqueue(queue, items, shard_size=2)
+    client = FakeGeminiBatchClient()
+
+    summary = run_batch_worker(
+        str(queue),
+        str(tmp_path / "out"),
+        GeminiBatchBackend(client),
+        node="a",
+        poll_interval=0,
+    )
+
+    assert summary == {"node": "a", "done": 5, "failed": 0, "lost": 0}
+    assert len(client.jobs) == 3
+    assert queue_stats(queue)["shards"] == {"done": 3}
+    assert len(list((tmp_path / "out").glob("*.png"))) == 5